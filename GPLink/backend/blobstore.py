@@ -0,0 +1,202 @@
+"""
+GPLink - Blob Store
+Content-addressed image storage: one file per distinct image, reference-counted from consultations
+"""
+
+from database import blobs_collection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import re
+
+UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
+UPLOADS_DIR.mkdir(exist_ok=True)
+
+# Blobs are sharded two levels deep by hash prefix (blobs/ab/cd/abcd...png)
+# so no directory grows past a few hundred entries
+BLOBS_DIR = UPLOADS_DIR / "blobs"
+
+# Derived files (thumbnails, see renditions.py) are sharded the same way by image hash
+RENDITIONS_DIR = UPLOADS_DIR / "renditions"
+
+# A blob name is "<sha256>.<ext>"; it is what consultations store and image URLs use
+BLOB_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,8})?$")
+EXTENSION_PATTERN = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# The release that drops a blob to zero references marks it "deleting" before unlinking
+# its file, and removes the document only afterwards; store() waits such a tombstone out
+LIVE_BLOB = {"state": {"$ne": "deleting"}}
+TOMBSTONE_POLL_SECONDS = 0.05
+# A tombstone older than this was left by a worker that died mid-release
+TOMBSTONE_TIMEOUT = timedelta(seconds=60)
+
+def is_blob_name(name: str) -> bool:
+    return bool(name) and BLOB_NAME_PATTERN.match(name) is not None
+
+def is_valid_name(name: str) -> bool:
+    """A name we may serve: a blob name, or a bare pre-blob filename (no paths or dotfiles)"""
+    if is_blob_name(name):
+        return True
+    return (bool(name) and len(name) <= 255 and not name.startswith(".")
+            and "/" not in name and "\\" not in name and "\x00" not in name)
+
+def blob_name(sha256: str, filename: str) -> str:
+    """Blob name for content with this hash, keeping the original extension for content types"""
+    extension = Path(filename or "").suffix.lower()
+    return sha256 + (extension if EXTENSION_PATTERN.match(extension) else "")
+
+def file_path(name: str) -> Path:
+    """Where a stored image lives: blobs by hash shard, older per-consultation uploads flat in uploads/"""
+    if is_blob_name(name):
+        return BLOBS_DIR / name[:2] / name[2:4] / name
+    return UPLOADS_DIR / Path(name).name
+
+def rendition_stem(name: str) -> Path:
+    """Path prefix shared by an image's renditions: renditions/ab/cd/<hash>"""
+    key = name.split(".")[0] if is_blob_name(name) else hashlib.sha256(name.encode("utf-8")).hexdigest()
+    return RENDITIONS_DIR / key[:2] / key[2:4] / key
+
+def _delete_with_renditions(name: str):
+    file_path(name).unlink(missing_ok=True)
+    stem = rendition_stem(name)
+    if stem.parent.exists():
+        for rendition in stem.parent.glob(f"{stem.name}_w*"):
+            rendition.unlink(missing_ok=True)
+
+def _place(source: Path, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    # An existing copy has identical content, so replacing it is harmless and keeps the move atomic
+    os.replace(source, destination)
+
+def hash_file(path: Path) -> dict:
+    """SHA-256 and size of a file on disk (blocking - run in a thread)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return {"sha256": digest.hexdigest(), "size": size}
+
+async def store(staged: dict) -> str:
+    """
+    Move a staged file {path, sha256, size, filename} into the store and take one reference.
+
+    Returns the blob name. Identical content uploaded again ends up as the same single file.
+    """
+    name = blob_name(staged["sha256"], staged["filename"])
+    # Take the reference before placing the file, so a concurrent release of the
+    # last reference never sees zero and deletes the copy we are about to use
+    while True:
+        try:
+            await blobs_collection().update_one(
+                {"_id": name, **LIVE_BLOB},
+                {
+                    "$inc": {"refcount": 1},
+                    "$set": {"acquired_at": datetime.now()},
+                    "$setOnInsert": {"size": staged["size"], "created_at": datetime.now()}
+                },
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            # Tombstoned (or a concurrent first store won the insert): retry once it settles
+            await _wait_for_tombstone(name)
+    try:
+        await asyncio.to_thread(_place, staged["path"], file_path(name))
+    except OSError:
+        await release(name)
+        raise
+    return name
+
+async def _wait_for_tombstone(name: str):
+    """Return once no release is deleting this blob; an abandoned tombstone is cleared"""
+    while True:
+        blob = await blobs_collection().find_one({"_id": name}, {"state": 1, "deleting_at": 1})
+        if not blob or blob.get("state") != "deleting":
+            return
+        if blob["deleting_at"] < datetime.now() - TOMBSTONE_TIMEOUT:
+            # Any file left behind is re-placed by the caller's store() or swept as an orphan
+            await blobs_collection().delete_one({"_id": name, "state": "deleting", "deleting_at": blob["deleting_at"]})
+            return
+        await asyncio.sleep(TOMBSTONE_POLL_SECONDS)
+
+async def acquire(name: str) -> bool:
+    """
+    Add a reference to an existing blob (e.g. one image attached to another consultation).
+
+    False if there is no such blob, or its file is being deleted - store() the content again instead.
+    """
+    if not is_blob_name(name):
+        return False
+    result = await blobs_collection().update_one(
+        {"_id": name, **LIVE_BLOB},
+        {"$inc": {"refcount": 1}, "$set": {"acquired_at": datetime.now()}}
+    )
+    return result.matched_count > 0
+
+async def existing(names) -> set:
+    """Which of these names are blobs currently in the store"""
+    names = [name for name in set(names) if is_blob_name(name)]
+    if not names:
+        return set()
+    return {blob["_id"] async for blob in blobs_collection().find({"_id": {"$in": names}, **LIVE_BLOB}, {"_id": 1})}
+
+async def release(name: str):
+    """Drop one reference; the file is deleted once nothing refers to it"""
+    if not name:
+        return
+    if not is_blob_name(name):
+        # Pre-blob uploads were named per consultation, so nothing else can share them
+        await asyncio.to_thread(_delete_with_renditions, name)
+        return
+    blob = await blobs_collection().find_one_and_update(
+        {"_id": name, **LIVE_BLOB},
+        {"$inc": {"refcount": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if blob and blob["refcount"] <= 0:
+        # Only delete if still unreferenced - another upload may have re-acquired it meanwhile.
+        # The tombstone makes a concurrent store() of this content wait until the file is gone
+        tombstone = await blobs_collection().update_one(
+            {"_id": name, "refcount": {"$lte": 0}, **LIVE_BLOB},
+            {"$set": {"state": "deleting", "deleting_at": datetime.now()}}
+        )
+        if tombstone.modified_count:
+            try:
+                await asyncio.to_thread(_delete_with_renditions, name)
+            finally:
+                await blobs_collection().delete_one({"_id": name, "state": "deleting"})
+
+async def release_many(names: list):
+    """Release every name in the list (safe to run as a background task)"""
+    for name in names:
+        try:
+            await release(name)
+        except Exception as e:
+            print(f"Error releasing image {name}: {e}")
+
+async def adopt(path: Path) -> str:
+    """Move a pre-blob upload into the store and take one reference; returns its blob name"""
+    digest = await asyncio.to_thread(hash_file, path)
+    return await store({"path": path, "filename": path.name, **digest})
+
+# ============= ANALYSIS CACHE =============
+
+async def get_analysis(name: str, image_type: str):
+    """AI analysis previously computed for this exact image, if any"""
+    if not is_blob_name(name):
+        return None
+    blob = await blobs_collection().find_one({"_id": name}, {f"analysis.{image_type}": 1})
+    return (blob or {}).get("analysis", {}).get(image_type)
+
+async def save_analysis(name: str, image_type: str, analysis: str):
+    """Remember an image's AI analysis so the same image is never analysed twice"""
+    if is_blob_name(name):
+        await blobs_collection().update_one({"_id": name}, {"$set": {f"analysis.{image_type}": analysis}})
@@ -0,0 +1,61 @@
+"""
+GPLink - Page Bootstrap
+Role-scoped data bundles so each Streamlit rerun needs a single API call
+"""
+
+from models import DoctorRole
+import asyncio
+import crud
+import directory
+
+CARDIOLOGIST_FIELDS = {"_id": 0, "email": 1, "name": 1, "hospital_clinic": 1}
+
+def role_scope(user: dict) -> dict:
+    """Consultation scope for a user: admins see everything, doctors see their own cases"""
+    if user["role"] == DoctorRole.CLINIC.value:
+        return {"clinic_doctor_email": user["email"]}
+    if user["role"] == DoctorRole.CARDIOLOGIST.value:
+        return {"cardiologist_email": user["email"]}
+    return {}
+
+def _page_queries(page: str, user: dict, status: str = None) -> dict:
+    """Un-awaited queries that make up a page's bundle, keyed by bundle field"""
+    scope = role_scope(user)
+    if page == "home":
+        return {"stats": crud.get_statistics()}
+    if page == "new-consultation":
+        return {"cardiologists": crud.get_doctors_by_role(DoctorRole.CARDIOLOGIST.value, CARDIOLOGIST_FIELDS)}
+    if page == "consultations":
+        return {"consultations": crud.get_all_consultations(status, crud.MAX_PAGE_SIZE, **scope)}
+    if page == "respond":
+        return {"queue": crud.get_cardiologist_queue(user["email"])}
+    if page == "statistics":
+        return {
+            "stats": crud.get_statistics(**scope),
+            "consultations": crud.get_all_consultations(
+                limit=crud.MAX_PAGE_SIZE, projection=crud.build_projection("summary"), **scope
+            )
+        }
+    if page == "doctors":
+        return {"doctors": crud.get_all_doctors()}
+    if page == "sidebar":
+        return {}
+    raise KeyError(page)
+
+BOOTSTRAP_PAGES = ("home", "new-consultation", "consultations", "respond", "statistics", "doctors", "sidebar")
+
+async def build_bundle(page: str, email: str, status: str = None):
+    """
+    Everything a page needs for one render: the user, sidebar counters and the page's data.
+
+    Returns None for an unknown user; raises KeyError for an unknown page.
+    """
+    if page not in BOOTSTRAP_PAGES:
+        raise KeyError(page)
+    user = await directory.lookup(email)
+    if not user:
+        return None
+
+    queries = {"counters": crud.get_counters(email), **_page_queries(page, user, status)}
+    results = await asyncio.gather(*queries.values())
+    return {"page": page, "user": user, **dict(zip(queries, results))}
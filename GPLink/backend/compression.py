@@ -0,0 +1,120 @@
+"""
+GPLink - Response Compression
+ASGI middleware that Brotli- or gzip-compresses responses above a size threshold
+"""
+
+from starlette.datastructures import Headers, MutableHeaders
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Only text-like bodies are worth compressing - uploaded images are already compressed
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+class _GzipEncoder:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # Sync-flush intermediate chunks so streamed exports reach the client promptly
+        tail = self._compressor.flush() if final else self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return self._compressor.compress(data) + tail
+
+class _BrotliEncoder:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        tail = self._compressor.finish() if final else self._compressor.flush()
+        return self._compressor.process(data) + tail
+
+class CompressionMiddleware:
+    """
+    Compress HTTP responses of at least `minimum_size` bytes.
+
+    Brotli is preferred when the client accepts it and the `brotli` package is
+    installed, otherwise gzip. Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _encoder(self, scope):
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        tokens = {token.split(";")[0].strip().lower() for token in accepted.split(",")}
+        if brotli is not None and "br" in tokens:
+            return _BrotliEncoder(self.brotli_quality)
+        if "gzip" in tokens:
+            return _GzipEncoder(self.gzip_level)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoder = self._encoder(scope)
+        if encoder is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        state = {"mode": None}  # None until the first body chunk, then "identity" or "compress"
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state["mode"] is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                compressible = (
+                    "content-encoding" not in headers
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if not compressible:
+                    state["mode"] = "identity"
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                state["mode"] = "compress"
+                body = encoder.compress(body, final=not more_body)
+                headers["Content-Encoding"] = encoder.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if state["mode"] == "identity":
+                await send(message)
+                return
+            await send({
+                "type": "http.response.body",
+                "body": encoder.compress(body, final=not more_body),
+                "more_body": more_body
+            })
+
+        await self.app(scope, receive, send_wrapper)
@@ -3,90 +3,157 @@ GPLink - CRUD Operations
 Database operations for consultations and doctors
 """
 
-from database import consultations_collection, doctors_collection
-from models import Consultation, Doctor, ConsultationStatus
+from database import (
+    consultations_collection, doctors_collection, counters_collection, messages_collection
+)
+from pymongo import UpdateOne, DeleteOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from models import Consultation, Doctor, ConsultationStatus, DoctorRole
 from datetime import datetime
 from bson import ObjectId
-import uuid
+from bson.errors import InvalidId
+import asyncio
+import base64
+import json
+import re
+import ids
+import response_cache
+import directory
+import blobstore
+from response_cache import DOCTORS, CONSULTATIONS
 import os
 import shutil
 from pathlib import Path
 
-# Create uploads directory if it doesn't exist
-UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
-
-# Create uploads directory if it doesn't exist
-UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
-
-def save_uploaded_file(file_content: bytes, filename: str, consultation_id: str) -> str:
-    """Save uploaded image file and return the saved filename"""
-    try:
-        # Create unique filename with consultation ID
-        file_extension = Path(filename).suffix
-        unique_filename = f"{consultation_id}_{filename}"
-        file_path = UPLOADS_DIR / unique_filename
-        
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        return unique_filename
-    except Exception as e:
-        print(f"Error saving file: {e}")
-        return None
+# Images live in the content-addressed blob store (see blobstore.py)
+UPLOADS_DIR = blobstore.UPLOADS_DIR
+IMAGE_FIELDS = ("ecg_image", "xray_image")
 
 def get_file_path(filename: str) -> Path:
     """Get full path to uploaded file"""
-    return UPLOADS_DIR / filename
+    return blobstore.file_path(filename)
+
+def image_names(consultation: dict) -> list:
+    """Stored image names attached to a consultation"""
+    patient = consultation.get("patient") or {}
+    return [patient[field] for field in IMAGE_FIELDS if patient.get(field)]
+
+# ============= VERSIONING =============
+# Every consultation and doctor carries a `version` bumped on each write plus
+# an `updated_at` timestamp; GET endpoints derive strong ETags from them.
+
+def versioned(update: dict) -> dict:
+    """Add a version bump and updated_at to a MongoDB update document"""
+    update = dict(update)
+    update["$inc"] = {**update.get("$inc", {}), "version": 1}
+    update["$set"] = {**update.get("$set", {}), "updated_at": datetime.now()}
+    return update
+
+def new_version(document: dict) -> dict:
+    """Stamp a document that is about to be inserted as version 1"""
+    document["version"] = 1
+    document["updated_at"] = document.get("created_at") or datetime.now()
+    return document
 
 # ============= DOCTORS =============
 
-def create_doctor(doctor: Doctor):
+async def create_doctor(doctor: Doctor):
     """Register a new doctor"""
     try:
         doctor_dict = doctor.model_dump()
-        result = doctors_collection.insert_one(doctor_dict)
+        result = await doctors_collection().insert_one(new_version(doctor_dict))
+        directory.invalidate(doctor_dict["email"])
+        await response_cache.invalidate(DOCTORS)
         return {"success": True, "doctor_id": str(result.inserted_id)}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def get_doctor_by_email(email: str):
-    """Get doctor by email"""
-    doctor = doctors_collection.find_one({"email": email})
+async def insert_doctor(doctor_data: dict) -> str:
+    """Insert an already-hashed doctor document; raises DuplicateKeyError on a taken email"""
+    result = await doctors_collection().insert_one(new_version(doctor_data))
+    directory.invalidate(doctor_data["email"])
+    await response_cache.invalidate(DOCTORS)
+    return str(result.inserted_id)
+
+async def bulk_insert(collection, documents: list) -> dict:
+    """Unordered insert_many; returns {index: error message} for documents that failed"""
+    if not documents:
+        return {}
+    try:
+        await collection.insert_many(documents, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        return {error["index"]: error.get("errmsg", "Write error") for error in e.details.get("writeErrors", [])}
+
+async def bulk_insert_doctors(doctors: list) -> dict:
+    """Insert already-hashed doctor documents in one unordered batch"""
+    errors = await bulk_insert(doctors_collection(), [new_version(doctor) for doctor in doctors])
+    directory.invalidate(*(doctor["email"] for doctor in doctors))
+    await response_cache.invalidate(DOCTORS)
+    return errors
+
+async def get_doctors_by_emails(emails: list) -> dict:
+    """Look up many doctors at once; returns {email: doctor}"""
+    doctors = await doctors_collection().find(
+        {"email": {"$in": list(set(emails))}},
+        {"password": 0}
+    ).to_list(length=None)
+    return {doctor["email"]: doctor for doctor in doctors}
+
+DOCTOR_NAME_SORT = [("name", 1)]
+
+# Everything but the password hash: what any doctor listing or profile may return
+PUBLIC_DOCTOR_FIELDS = {"password": 0}
+
+async def get_doctors_by_role(role: str, projection: dict = None):
+    """Get doctors with a given role, sorted by name"""
+    return await doctors_collection().find({"role": role}, projection).sort(DOCTOR_NAME_SORT).to_list(length=None)
+
+async def set_doctor_password(email: str, hashed_password: str) -> bool:
+    """Store a new password hash for a doctor; returns False if the doctor does not exist"""
+    result = await doctors_collection().update_one(
+        {"email": email},
+        versioned({"$set": {"password": hashed_password}})
+    )
+    await response_cache.invalidate(DOCTORS)
+    return result.matched_count > 0
+
+async def get_doctor_by_email(email: str, projection: dict = None):
+    """Get doctor by email (including the password hash unless projected out)"""
+    doctor = await doctors_collection().find_one({"email": email}, projection)
     if doctor:
         doctor["_id"] = str(doctor["_id"])
     return doctor
 
-def get_all_doctors():
-    """Get all registered doctors"""
-    doctors = list(doctors_collection.find())
-    for doc in doctors:
-        doc["_id"] = str(doc["_id"])
-    return doctors
+async def get_all_doctors():
+    """Get all registered doctors, without password hashes"""
+    return await doctors_collection().find({}, PUBLIC_DOCTOR_FIELDS).to_list(length=None)
 
-def update_doctor(email: str, doctor: Doctor):
+async def update_doctor(email: str, doctor: Doctor):
     """Update doctor information"""
     try:
         doctor_dict = doctor.dict()
         # Update using old email to find the document
-        result = doctors_collection.update_one(
+        result = await doctors_collection().update_one(
             {"email": email},
-            {"$set": doctor_dict}
+            versioned({"$set": doctor_dict})
         )
         if result.matched_count > 0:
+            directory.invalidate(email, doctor_dict["email"])
+            await response_cache.invalidate(DOCTORS)
             return {"success": True, "message": "Doctor updated successfully"}
         else:
             return {"success": False, "error": "Doctor not found"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def delete_doctor(email: str):
+async def delete_doctor(email: str):
     """Delete doctor by email"""
     try:
-        result = doctors_collection.delete_one({"email": email})
+        result = await doctors_collection().delete_one({"email": email})
         if result.deleted_count > 0:
+            directory.invalidate(email)
+            await response_cache.invalidate(DOCTORS)
             return {"success": True, "message": "Doctor deleted successfully"}
         else:
             return {"success": False, "error": "Doctor not found"}
@@ -95,51 +162,88 @@ def delete_doctor(email: str):
 
 # ============= CONSULTATIONS =============
 
-def create_consultation(consultation_data: dict, clinic_doctor_email: str):
+# IDs are "CON-" + a ULID, so they sort by creation time and unique index
+# inserts always land at the right-hand edge. Older records used 8 random hex
+# digits; rekey_legacy_consultations() moves them to the new format.
+CONSULTATION_ID_PREFIX = "CON-"
+LEGACY_ID_PATTERN = re.compile(r"^CON-[0-9A-F]{8}$")
+
+def new_consultation_id(created_at: datetime = None) -> str:
+    """Generate a time-ordered consultation ID (embedding created_at when given)"""
+    ulid = ids.ulid_from_datetime(created_at) if created_at else ids.new_ulid()
+    return f"{CONSULTATION_ID_PREFIX}{ulid}"
+
+def build_consultation(consultation_data: dict, clinic_doctor: dict, assigned_cardio_name: str = None,
+                       created_at: datetime = None) -> dict:
+    """
+    Build a new pending consultation document from request data.
+
+    created_at is only passed for historical records (import); live consultations
+    get a monotonic ID so cases created in the same millisecond still sort in order.
+    """
+    consultation_id = new_consultation_id(created_at)
+    created_at = created_at or datetime.now()
+    return new_version({
+        "consultation_id": consultation_id,
+        "patient": consultation_data["patient"],
+        "symptoms": consultation_data["symptoms"],
+        "vital_signs": consultation_data["vital_signs"],
+        "clinic_doctor_email": clinic_doctor["email"],
+        "clinic_doctor_name": clinic_doctor["name"],
+        "urgency": consultation_data.get("urgency", "normal"),
+        "urgency_rank": urgency_rank(consultation_data.get("urgency", "normal")),
+        "status": ConsultationStatus.PENDING.value,
+        "created_at": created_at,
+        "assigned_cardiologist_email": consultation_data.get("assigned_cardiologist_email"),
+        "assigned_cardiologist_name": assigned_cardio_name,
+        "lab_investigations": consultation_data.get("lab_investigations", []),
+        "lab_remarks": consultation_data.get("lab_remarks"),
+        "image_remarks": consultation_data.get("image_remarks"),
+        "provisional_diagnosis": consultation_data.get("provisional_diagnosis"),
+        # Follow-up discussion lives in consultation_messages; only its summary is kept here
+        "message_count": 0,
+        "last_activity_at": created_at,
+        "diagnosis": None,
+        "recommendations": None,
+        "cardiologist_notes": None,
+        "cardiologist_email": None,
+        "cardiologist_name": None,
+        "response_date": None
+    })
+
+async def create_consultation(consultation_data: dict, clinic_doctor_email: str):
     """Create new consultation request from clinic doctor"""
     try:
-        # Get clinic doctor info
-        clinic_doctor = get_doctor_by_email(clinic_doctor_email)
+        notes = consultation_data.get("followup_notes") or []
+        error = followup_notes_error(notes)
+        if error:
+            return {"success": False, "error": error}
+        
+        # Names are denormalised from the in-process directory, not fetched per request
+        clinic_doctor = await directory.lookup(clinic_doctor_email)
         if not clinic_doctor:
             return {"success": False, "error": "Clinic doctor not found"}
         
-        # Generate unique consultation ID
-        consultation_id = f"CON-{uuid.uuid4().hex[:8].upper()}"
-        
         # Get assigned cardiologist info if provided
         assigned_cardio_email = consultation_data.get("assigned_cardiologist_email")
         assigned_cardio_name = None
         if assigned_cardio_email:
-            assigned_cardio = get_doctor_by_email(assigned_cardio_email)
+            assigned_cardio = await directory.lookup(assigned_cardio_email)
             if assigned_cardio:
                 assigned_cardio_name = assigned_cardio["name"]
         
-        consultation = {
-            "consultation_id": consultation_id,
-            "patient": consultation_data["patient"],
-            "symptoms": consultation_data["symptoms"],
-            "vital_signs": consultation_data["vital_signs"],
-            "clinic_doctor_email": clinic_doctor_email,
-            "clinic_doctor_name": clinic_doctor["name"],
-            "urgency": consultation_data.get("urgency", "normal"),
-            "status": ConsultationStatus.PENDING.value,
-            "created_at": datetime.now(),
-            "assigned_cardiologist_email": assigned_cardio_email,
-            "assigned_cardiologist_name": assigned_cardio_name,
-            "lab_investigations": consultation_data.get("lab_investigations", []),
-            "lab_remarks": consultation_data.get("lab_remarks"),
-            "image_remarks": consultation_data.get("image_remarks"),
-            "provisional_diagnosis": consultation_data.get("provisional_diagnosis"),
-            "followup_notes": consultation_data.get("followup_notes", []),
-            "diagnosis": None,
-            "recommendations": None,
-            "cardiologist_notes": None,
-            "cardiologist_email": None,
-            "cardiologist_name": None,
-            "response_date": None
-        }
+        consultation = build_consultation(consultation_data, clinic_doctor, assigned_cardio_name)
+        consultation_id = consultation["consultation_id"]
+        # Images are attached (and reference-counted) by the upload endpoints only
+        consultation["patient"] = {**consultation["patient"], **{field: None for field in IMAGE_FIELDS}}
+        # The initial insert already carries the thread's count, so the notes go in as one batch
+        thread = attach_thread(consultation, notes)
         
-        result = consultations_collection.insert_one(consultation)
+        await consultations_collection().insert_one(consultation)
+        if thread:
+            await messages_collection().insert_many(thread, ordered=False)
+        await adjust_counters(consultation, 1)
+        await response_cache.invalidate(CONSULTATIONS)
         return {
             "success": True,
             "consultation_id": consultation_id,
@@ -148,59 +252,161 @@ def create_consultation(consultation_data: dict, clinic_doctor_email: str):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def get_consultation(consultation_id: str):
-    """Get specific consultation by ID"""
-    consultation = consultations_collection.find_one({"consultation_id": consultation_id})
+async def resolve_consultation_id(consultation_id: str) -> str:
+    """The current ID for an old-style ID that was re-keyed; any other ID is returned unchanged"""
+    if LEGACY_ID_PATTERN.match(consultation_id):
+        rekeyed = await consultations_collection().find_one(
+            {"legacy_consultation_id": consultation_id}, {"consultation_id": 1}
+        )
+        if rekeyed:
+            return rekeyed["consultation_id"]
+    return consultation_id
+
+async def get_consultation(consultation_id: str):
+    """Get specific consultation by ID (old-style IDs still resolve after re-keying)"""
+    consultation = await consultations_collection().find_one(
+        {"consultation_id": await resolve_consultation_id(consultation_id)}
+    )
     if consultation:
         consultation["_id"] = str(consultation["_id"])
     return consultation
 
-def get_all_consultations(status: str = None):
-    """Get all consultations, optionally filtered by status"""
+# Keyset pagination on (created_at, _id). Both fields are sorted descending so
+# that the newest consultations come first; _id breaks ties between documents
+# created in the same millisecond.
+CONSULTATION_SORT = [("created_at", -1), ("_id", -1)]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(consultation: dict) -> str:
+    """Build an opaque cursor pointing just after the given consultation"""
+    payload = {
+        "t": consultation["created_at"].isoformat(),
+        "id": str(consultation["_id"])
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, ascending: bool = False) -> dict:
+    """Turn an opaque cursor back into a query that resumes after it"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        created_at = datetime.fromisoformat(payload["t"])
+        last_id = ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    after = "$gt" if ascending else "$lt"
+    return {
+        "$or": [
+            {"created_at": {after: created_at}},
+            {"created_at": created_at, "_id": {after: last_id}}
+        ]
+    }
+
+def resume_query(query: dict, cursor: str, ascending: bool = False) -> dict:
+    """query narrowed to the documents after a cursor (unchanged without one)"""
+    if not cursor:
+        return query
+    after = decode_cursor(cursor, ascending)
+    return {"$and": [query, after]} if query else after
+
+# Fields returned by ?view=summary - enough to render a list row
+SUMMARY_FIELDS = [
+    "consultation_id", "patient.name", "patient.ic_number", "urgency", "status",
+    "created_at", "response_date", "clinic_doctor_name", "assigned_cardiologist_name",
+    "message_count", "last_activity_at"
+]
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+def build_projection(view: str = None, fields: str = None) -> dict:
+    """Map ?view= / ?fields= onto a MongoDB projection (None means every field)"""
+    if view not in (None, "full", "summary"):
+        raise ValueError(f"Invalid view: {view}. Use 'full' or 'summary'")
+    
+    selected = list(SUMMARY_FIELDS) if view == "summary" else []
+    if fields:
+        for field in fields.split(","):
+            field = field.strip()
+            if not FIELD_NAME_PATTERN.match(field):
+                raise ValueError(f"Invalid field: {field}")
+            selected.append(field)
+    
+    if not selected:
+        return None
+    # created_at (with _id, included by default) is needed to build the next cursor,
+    # version to compute the page's ETag
+    selected += ["created_at", "version"]
+    # MongoDB rejects "patient" together with "patient.name"; the parent already covers it
+    selected = set(selected)
+    return {
+        field: 1 for field in selected
+        if not any(field.startswith(parent + ".") for parent in selected)
+    }
+
+async def paginate_consultations(query: dict, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None,
+                                 projection: dict = None):
+    """Return one page of consultations matching query plus the cursor for the next page"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = resume_query(query, cursor)
+    
+    # Fetch one extra document to know whether another page exists
+    consultations = await consultations_collection().find(query, projection).sort(
+        CONSULTATION_SORT
+    ).limit(limit + 1).to_list(length=None)
+    next_cursor = None
+    if len(consultations) > limit:
+        consultations = consultations[:limit]
+        next_cursor = encode_cursor(consultations[-1])
+    return {"items": consultations, "next_cursor": next_cursor}
+
+def scope_query(clinic_doctor_email: str = None, cardiologist_email: str = None) -> dict:
+    """Build the filter for consultations belonging to a GP or a cardiologist"""
     query = {}
+    if clinic_doctor_email:
+        query["clinic_doctor_email"] = clinic_doctor_email
+    if cardiologist_email:
+        # A cardiologist owns cases they responded to OR that were assigned to them
+        query["$or"] = [
+            {"cardiologist_email": cardiologist_email},
+            {"assigned_cardiologist_email": cardiologist_email}
+        ]
+    return query
+
+async def get_all_consultations(status: str = None, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None,
+                                clinic_doctor_email: str = None, cardiologist_email: str = None,
+                                projection: dict = None):
+    """Get a page of consultations, optionally filtered by status and owner"""
+    query = scope_query(clinic_doctor_email, cardiologist_email)
     if status:
         query["status"] = status
-    
-    consultations = list(consultations_collection.find(query).sort("created_at", -1))
-    for consult in consultations:
-        consult["_id"] = str(consult["_id"])
-    return consultations
-
-def get_consultations_by_clinic_doctor(email: str):
-    """Get all consultations created by a specific clinic doctor"""
-    consultations = list(consultations_collection.find(
-        {"clinic_doctor_email": email}
-    ).sort("created_at", -1))
-    
-    for consult in consultations:
-        consult["_id"] = str(consult["_id"])
-    return consultations
+    return await paginate_consultations(query, limit, cursor, projection)
 
-def delete_consultation(consultation_id: str):
-    """Delete a consultation by ID"""
-    try:
-        result = consultations_collection.delete_one({"consultation_id": consultation_id})
-        if result.deleted_count > 0:
-            return {"success": True, "message": "Consultation deleted successfully"}
-        else:
-            return {"success": False, "error": "Consultation not found"}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+async def get_consultations_by_clinic_doctor(email: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None,
+                                             projection: dict = None):
+    """Get a page of consultations created by a specific clinic doctor"""
+    return await paginate_consultations({"clinic_doctor_email": email}, limit, cursor, projection)
 
-def update_consultation(consultation_id: str, consultation_data: dict):
+async def update_consultation(consultation_id: str, consultation_data: dict):
     """Update consultation details"""
     try:
         # Build update data dynamically
         update_data = {}
         
         if "patient" in consultation_data:
-            update_data["patient"] = consultation_data["patient"]
+            # Image fields are reference-counted, so a full update never replaces them;
+            # they change only through the upload endpoints or PATCH
+            for key, value in (consultation_data["patient"] or {}).items():
+                if key not in IMAGE_FIELDS:
+                    update_data[f"patient.{key}"] = value
         if "symptoms" in consultation_data:
             update_data["symptoms"] = consultation_data["symptoms"]
         if "vital_signs" in consultation_data:
             update_data["vital_signs"] = consultation_data["vital_signs"]
         if "urgency" in consultation_data:
             update_data["urgency"] = consultation_data["urgency"]
+            update_data["urgency_rank"] = urgency_rank(consultation_data["urgency"])
         
         # Handle image URLs (including removal if set to None)
         if "ecg_image_url" in consultation_data:
@@ -208,28 +414,104 @@ def update_consultation(consultation_id: str, consultation_data: dict):
         if "xray_image_url" in consultation_data:
             update_data["xray_image_url"] = consultation_data["xray_image_url"]
         
-        # Check if consultation exists
-        existing = consultations_collection.find_one({"consultation_id": consultation_id})
-        if not existing:
-            return {"success": False, "error": "Consultation not found"}
-        
-        # Perform update if there's data to update
+        # Perform update if there's data to update (matched_count doubles as the existence check)
         if update_data:
-            result = consultations_collection.update_one(
+            result = await consultations_collection().update_one(
                 {"consultation_id": consultation_id},
-                {"$set": update_data}
+                versioned({"$set": update_data})
             )
+            if result.matched_count == 0:
+                return {"success": False, "error": "Consultation not found"}
+            await response_cache.invalidate(CONSULTATIONS)
             return {"success": True, "message": "Consultation updated successfully"}
-        else:
-            return {"success": True, "message": "No changes to update"}
+        
+        existing = await consultations_collection().find_one({"consultation_id": consultation_id}, {"_id": 1})
+        if not existing:
+            return {"success": False, "error": "Consultation not found"}
+        return {"success": True, "message": "No changes to update"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def update_consultation_response(consultation_id: str, response_data: dict, cardiologist_email: str):
+EXPORT_BATCH_SIZE = 500
+
+def iter_consultations(status: str = None, created_from: datetime = None, created_to: datetime = None,
+                       clinic_doctor_email: str = None, cardiologist_email: str = None):
+    """Return a batched cursor over matching consultations (newest first) for streaming"""
+    query = scope_query(clinic_doctor_email, cardiologist_email)
+    if status:
+        query["status"] = status
+    if created_from or created_to:
+        query["created_at"] = {}
+        if created_from:
+            query["created_at"]["$gte"] = created_from
+        if created_to:
+            query["created_at"]["$lt"] = created_to
+    return consultations_collection().find(query).sort(CONSULTATION_SORT).batch_size(EXPORT_BATCH_SIZE)
+
+# Sub-documents merged key by key on PATCH instead of being replaced wholesale
+MERGE_PATCH_FIELDS = ("patient", "vital_signs")
+
+def flatten_patch(changes: dict) -> dict:
+    """Turn a partial consultation into dotted $set paths (JSON merge-patch for sub-documents)"""
+    update_data = {}
+    for field, value in changes.items():
+        if field in MERGE_PATCH_FIELDS and not isinstance(value, dict):
+            raise ValueError(f"{field} must be an object")
+        if field in MERGE_PATCH_FIELDS:
+            for key, sub_value in value.items():
+                if not FIELD_NAME_PATTERN.match(key):
+                    raise ValueError(f"Invalid field: {field}.{key}")
+                update_data[f"{field}.{key}"] = sub_value
+        else:
+            update_data[field] = value
+    if "urgency" in update_data:
+        update_data["urgency_rank"] = urgency_rank(update_data["urgency"])
+    return update_data
+
+async def patch_consultation(consultation_id: str, changes: dict, projection: dict = None):
+    """Apply a partial update in one round trip and return the updated consultation"""
+    update_data = flatten_patch(changes)
+    image_changes = {f"patient.{field}" for field in IMAGE_FIELDS} & set(update_data)
+    
+    if image_changes:
+        # Image references are counted: read the replaced names in the same atomic
+        # update, so concurrent writers never both release the same old image
+        previous = await consultations_collection().find_one_and_update(
+            {"consultation_id": consultation_id},
+            versioned({"$set": update_data}),
+            projection={path: 1 for path in image_changes},
+            return_document=ReturnDocument.BEFORE
+        )
+        consultation = None
+        if previous:
+            await response_cache.invalidate(CONSULTATIONS)
+            for path in image_changes:
+                old = (previous.get("patient") or {}).get(path.split(".")[1])
+                if update_data[path] != old:
+                    await blobstore.acquire(update_data[path])
+                    await blobstore.release(old)
+            consultation = await consultations_collection().find_one({"consultation_id": consultation_id}, projection)
+    elif update_data:
+        consultation = await consultations_collection().find_one_and_update(
+            {"consultation_id": consultation_id},
+            versioned({"$set": update_data}),
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+        if consultation:
+            await response_cache.invalidate(CONSULTATIONS)
+    else:
+        consultation = await consultations_collection().find_one({"consultation_id": consultation_id}, projection)
+    
+    if consultation:
+        consultation["_id"] = str(consultation["_id"])
+    return consultation
+
+async def update_consultation_response(consultation_id: str, response_data: dict, cardiologist_email: str):
     """Cardiologist adds response to consultation"""
     try:
         # Get cardiologist info
-        cardiologist = get_doctor_by_email(cardiologist_email)
+        cardiologist = await directory.lookup(cardiologist_email)
         if not cardiologist:
             return {"success": False, "error": "Cardiologist not found"}
         
@@ -243,40 +525,503 @@ def update_consultation_response(consultation_id: str, response_data: dict, card
             "status": ConsultationStatus.REVIEWED.value
         }
         
-        result = consultations_collection.update_one(
+        previous = await consultations_collection().find_one_and_update(
             {"consultation_id": consultation_id},
-            {"$set": update_data}
+            versioned({"$set": update_data}),
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count > 0:
+        if previous:
+            await move_counters(previous, update_data["status"])
+            await response_cache.invalidate(CONSULTATIONS)
             return {"success": True, "message": "Response added successfully"}
         else:
             return {"success": False, "error": "Consultation not found"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def mark_consultation_completed(consultation_id: str):
+async def mark_consultation_completed(consultation_id: str):
     """Mark consultation as completed"""
     try:
-        result = consultations_collection.update_one(
+        previous = await consultations_collection().find_one_and_update(
             {"consultation_id": consultation_id},
-            {"$set": {"status": ConsultationStatus.COMPLETED.value}}
+            versioned({"$set": {"status": ConsultationStatus.COMPLETED.value}}),
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count > 0:
+        if previous:
+            await move_counters(previous, ConsultationStatus.COMPLETED.value)
+            await response_cache.invalidate(CONSULTATIONS)
             return {"success": True, "message": "Consultation marked as completed"}
         else:
             return {"success": False, "error": "Consultation not found"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def delete_consultation(consultation_id: str):
+async def delete_consultation(consultation_id: str):
     """Delete a consultation"""
     try:
-        result = consultations_collection.delete_one({"consultation_id": consultation_id})
-        if result.deleted_count > 0:
+        deleted = await consultations_collection().find_one_and_delete({"consultation_id": consultation_id})
+        if deleted:
+            await adjust_counters(deleted, -1)
+            await messages_collection().delete_many({"consultation_id": consultation_id})
+            await response_cache.invalidate(CONSULTATIONS)
+            await blobstore.release_many(image_names(deleted))
             return {"success": True, "message": "Consultation deleted successfully"}
         else:
             return {"success": False, "error": "Consultation not found"}
     except Exception as e:
         return {"success": False, "error": str(e)}
+
+# Deletes in flight at once; bounded so one request cannot take the whole connection pool
+BULK_DELETE_CONCURRENCY = 50
+
+async def bulk_delete_consultations(consultation_ids: list):
+    """
+    Delete many consultations concurrently; returns per-ID outcomes and images to release.
+
+    Each ID is removed with its own find_one_and_delete, so counters and images come from
+    the documents actually deleted - not from a read a concurrent update could have outdated.
+    """
+    ids = list(dict.fromkeys(consultation_ids))
+    projection = {
+        "consultation_id": 1, "status": 1, "clinic_doctor_email": 1,
+        "assigned_cardiologist_email": 1, "patient.ecg_image": 1, "patient.xray_image": 1
+    }
+    deleted = []
+    for i in range(0, len(ids), BULK_DELETE_CONCURRENCY):
+        batch = ids[i:i + BULK_DELETE_CONCURRENCY]
+        deleted.extend(await asyncio.gather(*(
+            consultations_collection().find_one_and_delete({"consultation_id": cid}, projection=projection)
+            for cid in batch
+        )))
+    deleted = [c for c in deleted if c]
+    deleted_ids = [c["consultation_id"] for c in deleted]
+    
+    if deleted_ids:
+        await asyncio.gather(
+            adjust_counters_many(deleted, -1),
+            messages_collection().delete_many({"consultation_id": {"$in": deleted_ids}})
+        )
+        await response_cache.invalidate(CONSULTATIONS)
+    
+    deleted_set = set(deleted_ids)
+    return {
+        "deleted": len(deleted_ids),
+        "results": {cid: ("deleted" if cid in deleted_set else "not_found") for cid in ids},
+        "files": [name for c in deleted for name in image_names(c)]
+    }
+
+async def consultation_exists(consultation_id: str) -> bool:
+    """Cheap existence check on the consultation_id index"""
+    return await consultations_collection().find_one({"consultation_id": consultation_id}, {"_id": 1}) is not None
+
+async def set_consultation_image(consultation_id: str, image_field: str, filename: str) -> bool:
+    """Attach a stored image (patient.ecg_image / patient.xray_image), releasing the one it replaces"""
+    previous = await consultations_collection().find_one_and_update(
+        {"consultation_id": consultation_id},
+        versioned({"$set": {f"patient.{image_field}": filename}}),
+        projection={f"patient.{image_field}": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
+        return False
+    await response_cache.invalidate(CONSULTATIONS)
+    await blobstore.release((previous.get("patient") or {}).get(image_field))
+    return True
+
+async def save_image_analysis(consultation_id: str, analysis_field: str, analysis: str) -> bool:
+    """Store AI analysis text (ecg_analysis / xray_analysis) on a consultation"""
+    result = await consultations_collection().update_one(
+        {"consultation_id": consultation_id},
+        versioned({"$set": {analysis_field: analysis}})
+    )
+    await response_cache.invalidate(CONSULTATIONS)
+    return result.matched_count > 0
+
+def build_messages(consultation: dict, notes: list) -> list:
+    """consultation_messages documents for follow-up notes ({note, from, email, timestamp?})"""
+    messages = []
+    for note in notes:
+        try:
+            created_at = datetime.fromisoformat(note["timestamp"].replace("Z", "+00:00")).replace(tzinfo=None)
+        except (KeyError, AttributeError, ValueError):
+            created_at = consultation["created_at"]
+        messages.append({
+            "consultation_id": consultation["consultation_id"],
+            "note": note["note"],
+            "from": note.get("from"),
+            "email": note.get("email"),
+            "created_at": created_at
+        })
+    return messages
+
+def followup_notes_error(notes: list):
+    """Why a list of follow-up notes cannot be stored, or None if every note is usable"""
+    if any(not isinstance(note, dict) or not note.get("note") for note in notes or []):
+        return "followup_notes: every note needs a 'note' text"
+    return None
+
+def attach_thread(consultation: dict, notes: list) -> list:
+    """Build a consultation's follow-up messages and record their count and latest activity on it"""
+    thread = build_messages(consultation, notes or [])
+    if thread:
+        consultation["message_count"] = len(thread)
+        consultation["last_activity_at"] = max(message["created_at"] for message in thread)
+    return thread
+
+async def bulk_insert_consultations(consultations: list, messages: dict = None) -> dict:
+    """
+    Insert consultation documents in one unordered batch and update counters for the ones stored.
+
+    messages maps consultation_id to its follow-up messages; only those of stored consultations are written.
+    Image fields are kept only when they name a blob already in this store; anything else is cleared.
+    """
+    # Import files carry no image data, so a name is only meaningful if the blob is already here
+    stored = await blobstore.existing(name for consultation in consultations for name in image_names(consultation))
+    for consultation in consultations:
+        patient = consultation.get("patient") or {}
+        for field in IMAGE_FIELDS:
+            if patient.get(field) and patient[field] not in stored:
+                patient[field] = None
+    
+    errors = await bulk_insert(consultations_collection(), consultations)
+    inserted = [c for index, c in enumerate(consultations) if index not in errors]
+    thread = [
+        message for consultation in inserted
+        for message in (messages or {}).get(consultation["consultation_id"], [])
+    ]
+    if thread:
+        await messages_collection().insert_many(thread, ordered=False)
+    await adjust_counters_many(inserted, 1)
+    await response_cache.invalidate(CONSULTATIONS)
+    for consultation in inserted:
+        for field in IMAGE_FIELDS:
+            name = consultation["patient"].get(field)
+            if name and not await blobstore.acquire(name):
+                # Its last reference was released since the check above
+                await consultations_collection().update_one(
+                    {"consultation_id": consultation["consultation_id"]},
+                    versioned({"$set": {f"patient.{field}": None}})
+                )
+    return errors
+
+async def rekey_legacy_consultations():
+    """Give old random-hex consultations a ULID ID derived from their created_at"""
+    rekeyed = 0
+    async for consultation in consultations_collection().find(
+        {"consultation_id": {"$regex": LEGACY_ID_PATTERN.pattern}},
+        {"consultation_id": 1, "created_at": 1}
+    ):
+        old_id = consultation["consultation_id"]
+        new_id = new_consultation_id(consultation["created_at"])
+        await consultations_collection().update_one(
+            {"_id": consultation["_id"]},
+            versioned({"$set": {"consultation_id": new_id, "legacy_consultation_id": old_id}})
+        )
+        await messages_collection().update_many(
+            {"consultation_id": old_id},
+            {"$set": {"consultation_id": new_id}}
+        )
+        rekeyed += 1
+    await response_cache.invalidate(CONSULTATIONS)
+    return {"success": True, "rekeyed": rekeyed}
+
+async def adopt_legacy_uploads():
+    """Move per-consultation uploads into the blob store and point consultations at their blob names"""
+    adopted = 0
+    missing = 0
+    async for consultation in consultations_collection().find(
+        {"$or": [{f"patient.{field}": {"$nin": [None, ""]}} for field in IMAGE_FIELDS]},
+        {"consultation_id": 1, **{f"patient.{field}": 1 for field in IMAGE_FIELDS}}
+    ):
+        for field in IMAGE_FIELDS:
+            name = (consultation.get("patient") or {}).get(field)
+            if not name or blobstore.is_blob_name(name):
+                continue
+            path = get_file_path(name)
+            if not path.exists():
+                missing += 1
+                continue
+            blob = await blobstore.adopt(path)
+            await consultations_collection().update_one(
+                {"_id": consultation["_id"]},
+                versioned({"$set": {f"patient.{field}": blob}})
+            )
+            adopted += 1
+    await response_cache.invalidate(CONSULTATIONS)
+    return {"success": True, "adopted": adopted, "missing": missing}
+
+# ============= FOLLOW-UP MESSAGES =============
+
+MESSAGE_SORT = [("created_at", 1), ("_id", 1)]
+
+async def add_consultation_message(consultation_id: str, message: dict):
+    """Append a follow-up message and bump the consultation's count and last activity"""
+    created_at = datetime.now()
+    
+    # Touch the consultation first so messages are never written for a missing case
+    result = await consultations_collection().update_one(
+        {"consultation_id": consultation_id},
+        versioned({"$inc": {"message_count": 1}, "$set": {"last_activity_at": created_at}})
+    )
+    if result.matched_count == 0:
+        return None
+    await response_cache.invalidate(CONSULTATIONS)
+    
+    doc = {
+        "consultation_id": consultation_id,
+        "note": message["note"],
+        "from": message.get("from"),
+        "email": message.get("email"),
+        "created_at": created_at
+    }
+    inserted = await messages_collection().insert_one(doc)
+    doc["_id"] = str(inserted.inserted_id)
+    return doc
+
+async def get_consultation_messages(consultation_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+    """Return one page of a consultation's messages, oldest first, plus the next cursor"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = resume_query({"consultation_id": consultation_id}, cursor, ascending=True)
+    
+    messages = await messages_collection().find(query).sort(MESSAGE_SORT).limit(limit + 1).to_list(length=None)
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1])
+    return {"items": messages, "next_cursor": next_cursor}
+
+# ============= CARDIOLOGIST QUEUE =============
+
+# Stored on every consultation as urgency_rank so the queue sort comes from an index
+URGENCY_RANK = {"emergency": 0, "urgent": 1, "normal": 2}
+
+# Most urgent first, then oldest first within the same urgency
+QUEUE_SORT = [("urgency_rank", 1), ("created_at", 1), ("_id", 1)]
+# "Assigned to others" is a $nin on the assignee, which cannot feed an index sort;
+# scanning pending cases in queue order and filtering is bounded by the limit instead
+QUEUE_ORDER_INDEX = [("status", 1)] + QUEUE_SORT
+QUEUE_LIMIT = 50
+
+# Enough to list a case; the selected case is fetched in full from GET /api/consultations/{id}
+QUEUE_FIELDS = {
+    "consultation_id": 1, "patient.name": 1, "urgency": 1, "created_at": 1, "clinic_doctor_name": 1,
+    "assigned_cardiologist_email": 1, "assigned_cardiologist_name": 1, "message_count": 1, "version": 1
+}
+
+def urgency_rank(urgency: str) -> int:
+    """Sort position of an urgency level (unknown levels sort last)"""
+    return URGENCY_RANK.get(urgency, len(URGENCY_RANK))
+
+def queue_filters(email: str) -> dict:
+    """The three pending-case buckets a cardiologist works from, as query filters"""
+    pending = ConsultationStatus.PENDING.value
+    return {
+        "assigned_to_me": {"status": pending, "assigned_cardiologist_email": email},
+        "unassigned": {"status": pending, "assigned_cardiologist_email": {"$in": [None, ""]}},
+        "assigned_to_others": {"status": pending, "assigned_cardiologist_email": {"$nin": [email, None, ""]}}
+    }
+
+async def get_cardiologist_queue(email: str, limit: int = QUEUE_LIMIT):
+    """Split pending consultations into the cardiologist's three work buckets (first `limit` of each)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    filters = queue_filters(email)
+    
+    async def bucket(name: str, query: dict):
+        cursor = consultations_collection().find(query, QUEUE_FIELDS).sort(QUEUE_SORT).limit(limit)
+        if name == "assigned_to_others":
+            cursor = cursor.hint(QUEUE_ORDER_INDEX)
+        return await cursor.to_list(length=None)
+    
+    results = await asyncio.gather(
+        *(bucket(name, query) for name, query in filters.items()),
+        *(consultations_collection().count_documents(query) for query in filters.values())
+    )
+    lists, counts = results[:len(filters)], results[len(filters):]
+    return {**dict(zip(filters, lists)), "counts": dict(zip(filters, counts)), "limit": limit}
+
+async def claim_consultation(consultation_id: str, cardiologist_email: str):
+    """Atomically assign an unassigned pending consultation to a cardiologist"""
+    try:
+        cardiologist = await directory.lookup(cardiologist_email)
+        if not cardiologist:
+            return {"success": False, "error": "Cardiologist not found", "code": 404}
+        
+        # The filter only matches while the case is still unassigned, so two
+        # cardiologists claiming concurrently cannot both succeed
+        previous = await consultations_collection().find_one_and_update(
+            {
+                "consultation_id": consultation_id,
+                "status": ConsultationStatus.PENDING.value,
+                "assigned_cardiologist_email": {"$in": [None, ""]}
+            },
+            versioned({"$set": {
+                "assigned_cardiologist_email": cardiologist_email,
+                "assigned_cardiologist_name": cardiologist["name"]
+            }}),
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if previous:
+            await adjust_counters(previous, -1)
+            await adjust_counters({**previous, "assigned_cardiologist_email": cardiologist_email}, 1)
+            await response_cache.invalidate(CONSULTATIONS)
+            return {"success": True, "message": "Consultation claimed successfully"}
+        
+        if not await consultations_collection().find_one({"consultation_id": consultation_id}, {"_id": 1}):
+            return {"success": False, "error": "Consultation not found", "code": 404}
+        return {"success": False, "error": "Consultation is no longer available to claim", "code": 409}
+    except Exception as e:
+        return {"success": False, "error": str(e), "code": 500}
+
+# ============= COUNTERS =============
+# Pre-aggregated consultation counts keyed by (scope, status) so dashboard and
+# sidebar badges are a single indexed read instead of a scan. Scopes:
+#   "all"                every consultation
+#   "gp:<email>"         consultations created by a clinic doctor
+#   "assigned:<email>"   consultations assigned to a cardiologist
+#   "unassigned"         consultations open to any available cardiologist
+
+def counter_scopes(consultation: dict) -> list:
+    """List the counter scopes a consultation contributes to"""
+    scopes = ["all", f"gp:{consultation['clinic_doctor_email']}"]
+    assigned = consultation.get("assigned_cardiologist_email")
+    scopes.append(f"assigned:{assigned}" if assigned else "unassigned")
+    return scopes
+
+async def adjust_counters(consultation: dict, delta: int, status: str = None):
+    """Atomically add delta to every counter the consultation belongs to"""
+    status = status or consultation["status"]
+    await counters_collection().bulk_write([
+        UpdateOne({"scope": scope, "status": status}, {"$inc": {"count": delta}}, upsert=True)
+        for scope in counter_scopes(consultation)
+    ], ordered=False)
+
+async def adjust_counters_many(consultations: list, delta: int):
+    """Like adjust_counters for many consultations, in a single bulk write"""
+    totals = {}
+    for consultation in consultations:
+        for scope in counter_scopes(consultation):
+            key = (scope, consultation["status"])
+            totals[key] = totals.get(key, 0) + delta
+    if totals:
+        await counters_collection().bulk_write([
+            UpdateOne({"scope": scope, "status": status}, {"$inc": {"count": count}}, upsert=True)
+            for (scope, status), count in totals.items()
+        ], ordered=False)
+
+async def move_counters(previous: dict, new_status: str):
+    """Move a consultation's counts from its previous status to new_status"""
+    if previous["status"] == new_status:
+        return
+    await adjust_counters(previous, -1)
+    await adjust_counters(previous, 1, new_status)
+
+async def get_counters(email: str):
+    """Get badge counts for a doctor: their GP cases, assigned cases and the unassigned pool"""
+    scopes = {f"gp:{email}": "clinic", f"assigned:{email}": "assigned", "unassigned": "unassigned"}
+    statuses = [status.value for status in ConsultationStatus]
+    result = {name: {status: 0 for status in statuses} for name in scopes.values()}
+    
+    async for counter in counters_collection().find({"scope": {"$in": list(scopes)}}):
+        result[scopes[counter["scope"]]][counter["status"]] = counter["count"]
+    return {"email": email, **result}
+
+async def reconcile_counters():
+    """Recompute every counter from consultations and overwrite the stored counts in place"""
+    groups = consultations_collection().aggregate([
+        {"$group": {
+            "_id": {
+                "clinic_doctor_email": "$clinic_doctor_email",
+                "assigned_cardiologist_email": "$assigned_cardiologist_email",
+                "status": "$status"
+            },
+            "count": {"$sum": 1}
+        }}
+    ])
+    
+    totals = {}
+    async for group in groups:
+        key = group["_id"]
+        for scope in counter_scopes(key):
+            totals[(scope, key["status"])] = totals.get((scope, key["status"]), 0) + group["count"]
+    
+    # Overwrite row by row instead of emptying the collection, so the counters never
+    # disappear and a concurrent $inc upsert cannot collide with our inserts
+    if totals:
+        await counters_collection().bulk_write([
+            UpdateOne({"scope": scope, "status": status}, {"$set": {"count": count}}, upsert=True)
+            for (scope, status), count in totals.items()
+        ], ordered=False)
+    
+    # Rows for scopes that no longer have consultations; matching on the count we read
+    # leaves any row a concurrent write has just incremented
+    stale = [
+        DeleteOne({"_id": row["_id"], "count": row["count"]})
+        async for row in counters_collection().find({}, {"scope": 1, "status": 1, "count": 1})
+        if (row["scope"], row["status"]) not in totals
+    ]
+    if stale:
+        await counters_collection().bulk_write(stale, ordered=False)
+    # Page bootstrap bundles embed counters
+    await response_cache.invalidate(CONSULTATIONS)
+    return {"success": True, "counters": len(totals)}
+
+# ============= STATISTICS =============
+
+def _counts(buckets: list) -> dict:
+    """Convert [{_id, count}] group output into a plain {key: count} dict"""
+    return {(b["_id"] if b["_id"] is not None else "unknown"): b["count"] for b in buckets}
+
+def statistics_pipeline(match: dict) -> list:
+    """Consultation counts by status, urgency and hospital for the consultations matching match"""
+    return [
+        {"$match": match},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_urgency": [{"$group": {"_id": "$urgency", "count": {"$sum": 1}}}],
+            # Group by GP first so the doctors lookup runs once per GP, not per case
+            "by_hospital": [
+                {"$group": {"_id": "$clinic_doctor_email", "count": {"$sum": 1}}},
+                {"$lookup": {
+                    "from": doctors_collection().name,
+                    "localField": "_id",
+                    "foreignField": "email",
+                    "as": "doctor"
+                }},
+                {"$group": {
+                    "_id": {"$ifNull": [{"$first": "$doctor.hospital_clinic"}, "unknown"]},
+                    "count": {"$sum": "$count"}
+                }}
+            ]
+        }}
+    ]
+
+async def get_statistics(clinic_doctor_email: str = None, cardiologist_email: str = None):
+    """Aggregate consultation and doctor counts inside MongoDB"""
+    pipeline = statistics_pipeline(scope_query(clinic_doctor_email, cardiologist_email))
+    # Consultation facets and doctor totals are independent, so run them concurrently
+    results, doctor_groups = await asyncio.gather(
+        consultations_collection().aggregate(pipeline).to_list(length=1),
+        doctors_collection().aggregate([
+            {"$group": {"_id": "$role", "count": {"$sum": 1}}}
+        ]).to_list(length=None)
+    )
+    facets = results[0] if results else {}
+    by_status = _counts(facets.get("by_status", []))
+    total = facets["total"][0]["count"] if facets.get("total") else 0
+    doctors_by_role = _counts(doctor_groups)
+    
+    return {
+        "total_consultations": total,
+        "pending": by_status.get(ConsultationStatus.PENDING.value, 0),
+        "reviewed": by_status.get(ConsultationStatus.REVIEWED.value, 0),
+        "completed": by_status.get(ConsultationStatus.COMPLETED.value, 0),
+        "by_urgency": _counts(facets.get("by_urgency", [])),
+        "by_hospital": _counts(facets.get("by_hospital", [])),
+        "total_doctors": sum(doctors_by_role.values()),
+        "total_clinic_doctors": doctors_by_role.get(DoctorRole.CLINIC.value, 0),
+        "total_cardiologists": doctors_by_role.get(DoctorRole.CARDIOLOGIST.value, 0)
+    }
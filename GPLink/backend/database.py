@@ -1,9 +1,9 @@
 """
 GPLink - Database Connection
-MongoDB connection setup for GPLink consultation system
+Async MongoDB (Motor) connection setup for GPLink consultation system
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
@@ -12,17 +12,59 @@ load_dotenv()
 mongo_uri = os.getenv("MONGODB_ATLAS_CLUSTER_URI")
 db_name = os.getenv("MONGODB_DATABASE_NAME", "gplink_db")
 
-# MongoDB Client
-client = MongoClient(mongo_uri)
-db = client[db_name]
+# Connection pool and wire compression (zstd needs the `zstandard` package)
+max_pool_size = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+min_pool_size = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+compressors = os.getenv("MONGODB_COMPRESSORS", "zlib")
+
+# MongoDB Client - created lazily, once per process. Nothing is connected at
+# import time, so pre-fork servers (gunicorn/uvicorn --workers) never share a
+# client across a fork: each worker builds its own on first use.
+_client = None
+_db = None
+_pid = None
+
+def get_db():
+    """Return this process's database handle, connecting on first use"""
+    global _client, _db, _pid
+    if _db is None or _pid != os.getpid():
+        _client = AsyncIOMotorClient(
+            mongo_uri,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            compressors=compressors
+        )
+        _db = _client[db_name]
+        _pid = os.getpid()
+    return _db
+
+def close():
+    """Close this process's client and its connection pool"""
+    global _client, _db, _pid
+    if _client is not None and _pid == os.getpid():
+        _client.close()
+    _client = None
+    _db = None
+    _pid = None
 
 # Collections
-consultations_collection = db["consultations"]
-doctors_collection = db["doctors"]
+def consultations_collection():
+    return get_db()["consultations"]
+
+def doctors_collection():
+    return get_db()["doctors"]
+
+def counters_collection():
+    return get_db()["counters"]
+
+def messages_collection():
+    return get_db()["consultation_messages"]
+
+def migrations_collection():
+    return get_db()["_migrations"]
 
-# Create indexes
-consultations_collection.create_index("consultation_id", unique=True)
-consultations_collection.create_index("status")
-doctors_collection.create_index("email", unique=True)
+def blobs_collection():
+    return get_db()["blobs"]
 
-print(f"✅ Connected to MongoDB: {db_name}")
+def jobs_collection():
+    return get_db()["_jobs"]
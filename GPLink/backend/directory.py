@@ -0,0 +1,46 @@
+"""
+GPLink - Doctor Directory
+In-process email -> name/role/hospital map so write paths can denormalise names without a lookup
+"""
+
+from database import doctors_collection
+from dotenv import load_dotenv
+import os
+import time
+
+load_dotenv()
+
+# Other workers' doctor edits only reach this process on its next full reload
+reload_seconds = int(os.getenv("DOCTOR_DIRECTORY_TTL", "300"))
+
+DIRECTORY_FIELDS = {"_id": 0, "email": 1, "name": 1, "role": 1, "hospital_clinic": 1}
+
+_entries = {}
+_loaded_at = None
+_pid = None
+
+async def load() -> int:
+    """(Re)load every doctor into this process's directory; returns the number loaded"""
+    global _entries, _loaded_at, _pid
+    doctors = await doctors_collection().find({}, DIRECTORY_FIELDS).to_list(length=None)
+    _entries = {doctor["email"]: doctor for doctor in doctors}
+    _loaded_at = time.monotonic()
+    _pid = os.getpid()
+    return len(_entries)
+
+async def lookup(email: str):
+    """Return {email, name, role, hospital_clinic} for a doctor, or None if there is no such doctor"""
+    if _loaded_at is None or _pid != os.getpid() or time.monotonic() - _loaded_at > reload_seconds:
+        await load()
+    entry = _entries.get(email)
+    if entry is None:
+        # Registered in another worker since our last load
+        entry = await doctors_collection().find_one({"email": email}, DIRECTORY_FIELDS)
+        if entry:
+            _entries[email] = entry
+    return entry
+
+def invalidate(*emails: str):
+    """Forget cached entries after a doctor is registered, updated or deleted"""
+    for email in emails:
+        _entries.pop(email, None)
@@ -0,0 +1,76 @@
+"""
+GPLink - Consultation Export
+Streams consultations as NDJSON or CSV without holding the result set in memory
+"""
+
+import csv
+import io
+import serialization
+
+# Flat CSV columns; dotted names are read from sub-documents
+CSV_COLUMNS = [
+    "consultation_id", "status", "urgency", "created_at", "response_date",
+    "patient.name", "patient.age", "patient.gender", "patient.ic_number",
+    "clinic_doctor_name", "clinic_doctor_email",
+    "assigned_cardiologist_name", "assigned_cardiologist_email",
+    "cardiologist_name", "cardiologist_email",
+    "symptoms", "provisional_diagnosis", "diagnosis", "recommendations",
+    "message_count", "last_activity_at",
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _field(doc: dict, path: str):
+    """Read a dotted path from a document, returning '' when missing"""
+    value = doc
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return ""
+        value = value.get(key)
+    if value is None:
+        return ""
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+# Rows per chunk written to the response; matches crud.EXPORT_BATCH_SIZE, so one chunk per cursor batch
+ROWS_PER_CHUNK = 500
+
+async def _batches(consultations):
+    """Group the cursor's documents into lists of ROWS_PER_CHUNK"""
+    batch = []
+    async for consultation in consultations:
+        batch.append(consultation)
+        if len(batch) == ROWS_PER_CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def ndjson_lines(consultations):
+    """Yield JSON documents, one per line, a batch of lines at a time"""
+    async for batch in _batches(consultations):
+        yield b"".join(serialization.dumps(consultation) + b"\n" for consultation in batch)
+
+async def csv_lines(consultations):
+    """Yield a header row followed by one CSV row per consultation, a batch of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+    
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    async for batch in _batches(consultations):
+        writer.writerows([_field(consultation, column) for column in CSV_COLUMNS] for consultation in batch)
+        yield flush()
+
+FORMATTERS = {
+    "ndjson": ndjson_lines,
+    "csv": csv_lines,
+}
@@ -0,0 +1,64 @@
+"""
+GPLink - HTTP Caching
+Strong ETags from document versions and If-None-Match handling for GET endpoints
+"""
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from pathlib import Path
+import serialization
+import hashlib
+
+# Content-addressed URLs never change meaning, so browsers and proxies may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def document_etag(document: dict) -> str:
+    """Strong ETag for a single versioned document"""
+    return f'"{document["_id"]}-{document.get("version", 0)}"'
+
+def collection_etag(documents: list, *extra) -> str:
+    """Strong ETag for a list: changes when any member, the membership or the query changes"""
+    digest = hashlib.sha1()
+    for part in extra:
+        digest.update(f"{part}\n".encode("utf-8"))
+    for document in documents:
+        digest.update(f"{document['_id']}:{document.get('version', 0)}\n".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison: a proxy may have weakened our tag to W/"..."
+    return etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+def body_response(request: Request, body: bytes, etag: str) -> Response:
+    """304 if the client already has this representation, otherwise the rendered JSON body with its ETag"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def conditional_response(request: Request, content, etag: str) -> Response:
+    """Render content and answer it conditionally (see body_response)"""
+    return body_response(request, serialization.dumps(content), etag)
+
+def file_etag(path: Path) -> str:
+    """ETag for a file whose name is not a content hash: changes whenever it is rewritten"""
+    stat = path.stat()
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def file_response(request: Request, path: Path, etag: str, immutable: bool = False,
+                  media_type: str = None) -> Response:
+    """
+    304 if the client already has this file, otherwise the file itself.
+
+    FileResponse answers Range requests with 206 (and honours If-Range against our ETag),
+    so large images can be resumed or fetched in parts.
+    """
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else "no-cache"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
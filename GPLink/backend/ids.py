@@ -0,0 +1,45 @@
+"""
+GPLink - Identifiers
+Time-ordered, ULID-style IDs: 48-bit millisecond timestamp + 80 random bits,
+encoded as 26 Crockford base32 characters so they sort by creation time
+"""
+
+from datetime import datetime
+import os
+import threading
+import time
+
+CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+RANDOM_BITS = 80
+
+_lock = threading.Lock()
+_last_timestamp = -1
+_last_random = 0
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(CROCKFORD_BASE32[remainder])
+    return "".join(reversed(chars))
+
+def new_ulid(timestamp_ms: int = None) -> str:
+    """Generate a ULID; IDs from the same process are strictly increasing"""
+    global _last_timestamp, _last_random
+    with _lock:
+        if timestamp_ms is None:
+            timestamp_ms = time.time_ns() // 1_000_000
+            # Same millisecond: bump the random part so ordering is kept (ULID monotonic mode)
+            if timestamp_ms <= _last_timestamp:
+                timestamp_ms = _last_timestamp
+                random_part = (_last_random + 1) % (1 << RANDOM_BITS)
+            else:
+                random_part = int.from_bytes(os.urandom(RANDOM_BITS // 8), "big")
+            _last_timestamp, _last_random = timestamp_ms, random_part
+        else:
+            random_part = int.from_bytes(os.urandom(RANDOM_BITS // 8), "big")
+    return _encode(timestamp_ms, 10) + _encode(random_part, 16)
+
+def ulid_from_datetime(dt: datetime) -> str:
+    """Generate a ULID whose timestamp part is dt (for re-keying existing records)"""
+    return new_ulid(int(dt.timestamp() * 1000))
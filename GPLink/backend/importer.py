@@ -0,0 +1,178 @@
+"""
+GPLink - Bulk Import
+NDJSON import of doctors and historical consultations with a per-line error report
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pydantic import ValidationError
+from models import Doctor, ConsultationImport
+import asyncio
+import bcrypt
+import json
+import multiprocessing
+import os
+import crud
+
+IMPORT_BATCH_SIZE = 1000
+
+# bcrypt is CPU-bound, so password hashing for imports runs in worker processes.
+# They are started by a fork server (or spawned), never forked from this process:
+# forking while Motor's threads hold locks can deadlock the child.
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+_pool = None
+
+def hash_passwords(passwords: list) -> list:
+    """bcrypt-hash a batch of passwords (truncated to 72 bytes, as on registration)"""
+    return [
+        bcrypt.hashpw(password.encode("utf-8")[:72], bcrypt.gensalt()).decode("utf-8")
+        for password in passwords
+    ]
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context(START_METHOD))
+    return _pool
+
+def shutdown_pool():
+    """Stop the hashing worker processes"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+async def _hash_in_pool(passwords: list) -> list:
+    """Spread a batch of passwords over the process pool"""
+    loop = asyncio.get_running_loop()
+    size = max(1, -(-len(passwords) // HASH_WORKERS))
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(*[
+        loop.run_in_executor(_get_pool(), hash_passwords, chunk) for chunk in chunks
+    ])
+    return [hashed for chunk in results for hashed in chunk]
+
+async def read_ndjson(chunks):
+    """Yield (line_number, record, error) for each non-empty line of a byte stream"""
+    buffer = b""
+    line_number = 0
+    
+    def parse(line: bytes):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return None, f"Invalid JSON: {e}"
+        if not isinstance(record, dict):
+            return None, "Each line must be a JSON object"
+        return record, None
+    
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield (line_number, *parse(line))
+    if buffer.strip():
+        yield (line_number + 1, *parse(buffer))
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+async def _import(chunks, validate, flush):
+    """Validate every line, flushing valid rows in batches; returns the import report"""
+    report = {"inserted": 0, "failed": 0, "errors": []}
+    batch = []
+    
+    async def flush_batch():
+        if not batch:
+            return
+        line_numbers = [line_number for line_number, _ in batch]
+        errors = await flush([row for _, row in batch])
+        for index, message in errors.items():
+            report["errors"].append({"line": line_numbers[index], "error": message})
+        report["inserted"] += len(batch) - len(errors)
+        report["failed"] += len(errors)
+        batch.clear()
+    
+    async for line_number, record, error in read_ndjson(chunks):
+        if error is None:
+            try:
+                batch.append((line_number, validate(record)))
+            except ValidationError as e:
+                error = _validation_message(e)
+        if error is not None:
+            report["errors"].append({"line": line_number, "error": error})
+            report["failed"] += 1
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush_batch()
+    await flush_batch()
+    
+    report["errors"].sort(key=lambda e: e["line"])
+    return report
+
+async def import_doctors(chunks):
+    """Import doctors from an NDJSON byte stream"""
+    async def flush(doctors):
+        hashed = await _hash_in_pool([doctor.password for doctor in doctors])
+        documents = []
+        for doctor, password in zip(doctors, hashed):
+            document = doctor.model_dump()
+            document["password"] = password
+            documents.append(document)
+        return await crud.bulk_insert_doctors(documents)
+    
+    return await _import(chunks, lambda record: Doctor(**record), flush)
+
+async def import_consultations(chunks):
+    """Import historical consultations from an NDJSON byte stream"""
+    async def flush(consultations):
+        emails = [c.clinic_doctor_email for c in consultations]
+        emails += [c.assigned_cardiologist_email for c in consultations if c.assigned_cardiologist_email]
+        emails += [c.cardiologist_email for c in consultations if c.cardiologist_email]
+        doctors = await crud.get_doctors_by_emails(emails)
+        
+        documents = []
+        messages = {}
+        errors = {}
+        for index, consultation in enumerate(consultations):
+            clinic_doctor = doctors.get(consultation.clinic_doctor_email)
+            if not clinic_doctor:
+                errors[index] = f"Clinic doctor not found: {consultation.clinic_doctor_email}"
+                continue
+            error = crud.followup_notes_error(consultation.followup_notes)
+            if error:
+                errors[index] = error
+                continue
+            data = consultation.model_dump(mode="json")
+            assigned = doctors.get(consultation.assigned_cardiologist_email)
+            document = crud.build_consultation(
+                data, clinic_doctor, assigned["name"] if assigned else None, consultation.created_at
+            )
+            
+            # Historical records may already have been answered
+            cardiologist = doctors.get(consultation.cardiologist_email)
+            document.update({
+                "status": consultation.status.value,
+                "diagnosis": consultation.diagnosis,
+                "recommendations": consultation.recommendations,
+                "cardiologist_notes": consultation.cardiologist_notes,
+                "cardiologist_email": consultation.cardiologist_email,
+                "cardiologist_name": cardiologist["name"] if cardiologist else None,
+                "response_date": consultation.response_date
+            })
+            
+            # Follow-up discussion goes to consultation_messages, as for live consultations
+            thread = crud.attach_thread(document, consultation.followup_notes)
+            if thread:
+                messages[document["consultation_id"]] = thread
+            documents.append((index, document))
+        
+        insert_errors = await crud.bulk_insert_consultations([document for _, document in documents], messages)
+        for position, message in insert_errors.items():
+            errors[documents[position][0]] = message
+        return errors
+    
+    return await _import(chunks, lambda record: ConsultationImport(**record), flush)
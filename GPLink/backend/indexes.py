@@ -0,0 +1,183 @@
+"""
+GPLink - Index Catalogue
+Every index the API relies on, and the query shapes each one serves
+"""
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from database import get_db
+from datetime import datetime
+from bson import ObjectId
+import crud
+
+# Newest-first ordering used by every consultation list (see crud.CONSULTATION_SORT)
+NEWEST_FIRST = [("created_at", DESCENDING), ("_id", DESCENDING)]
+# Cardiologist queue ordering: most urgent, then oldest (see crud.QUEUE_SORT)
+QUEUE_ORDER = [("urgency_rank", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]
+
+INDEX_CATALOGUE = {
+    "consultations": [
+        # get_consultation, update/delete/claim by ID
+        IndexModel([("consultation_id", ASCENDING)], unique=True),
+        # Old random-hex IDs kept after re-keying so existing links still resolve
+        IndexModel([("legacy_consultation_id", ASCENDING)], sparse=True),
+        # GET /api/consultations (unfiltered and ?status=)
+        IndexModel(NEWEST_FIRST),
+        IndexModel([("status", ASCENDING)] + NEWEST_FIRST),
+        # GP lists: /api/consultations/doctor/{email}, ?clinic_doctor_email= (+ status filter)
+        IndexModel([("clinic_doctor_email", ASCENDING)] + NEWEST_FIRST),
+        IndexModel([("clinic_doctor_email", ASCENDING), ("status", ASCENDING)] + NEWEST_FIRST),
+        # Cardiologist scope is an $or over these two fields; each branch needs its own index
+        IndexModel([("cardiologist_email", ASCENDING)] + NEWEST_FIRST),
+        IndexModel([("assigned_cardiologist_email", ASCENDING)] + NEWEST_FIRST),
+        # Cardiologist work queue (see crud.QUEUE_SORT) and claim filter
+        IndexModel([("status", ASCENDING), ("assigned_cardiologist_email", ASCENDING)] + QUEUE_ORDER),
+        IndexModel([("status", ASCENDING)] + QUEUE_ORDER),
+    ],
+    "doctors": [
+        # Login, profile lookups and the $lookup in get_statistics
+        IndexModel([("email", ASCENDING)], unique=True),
+        # Cardiologist picker and bootstrap bundles (crud.get_doctors_by_role)
+        IndexModel([("role", ASCENDING), ("name", ASCENDING)]),
+    ],
+    "consultation_messages": [
+        # Follow-up discussion, paged oldest first
+        IndexModel([("consultation_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "counters": [
+        IndexModel([("scope", ASCENDING), ("status", ASCENDING)], unique=True),
+    ],
+}
+
+# Indexes made redundant by a catalogue entry with the same prefix
+REDUNDANT_INDEXES = {
+    "consultations": ["status_1", "status_1_assigned_cardiologist_email_1"],
+}
+
+# Representative shape of every query the API issues, built from the same
+# filters/sorts/pipelines crud uses where those are factored out.
+# check_query_plans() explains each one; none may need a COLLSCAN or in-memory SORT.
+_EMAIL = "doctor@example.com"
+
+def _find(name: str, collection: str, query: dict, sort: list = None, hint: list = None) -> dict:
+    return {"name": name, "collection": collection, "query": query, "sort": sort, "hint": hint}
+
+def _next_page(query: dict, ascending: bool = False) -> dict:
+    """query as a later page issues it: resumed from a real cursor, exactly as crud builds it"""
+    cursor = crud.encode_cursor({"created_at": datetime(2025, 6, 1), "_id": ObjectId("665a00000000000000000000")})
+    return crud.resume_query(query, cursor, ascending)
+
+def query_shapes() -> list:
+    """find() shapes: name, collection, query, sort and index hint"""
+    queue = crud.queue_filters(_EMAIL)
+    return [
+        _find("consultation by id", "consultations", {"consultation_id": "CON-00000000000000000000000000"}),
+        _find("consultation by legacy id", "consultations", {"legacy_consultation_id": "CON-00000000"}),
+        _find("consultation list", "consultations", {}, NEWEST_FIRST),
+        _find("consultation list by status", "consultations", {"status": "pending"}, NEWEST_FIRST),
+        _find("export date range", "consultations",
+              {"status": "completed", "created_at": {"$gte": datetime(2025, 1, 1)}}, NEWEST_FIRST),
+        _find("GP list", "consultations", crud.scope_query(clinic_doctor_email=_EMAIL), NEWEST_FIRST),
+        _find("GP list by status", "consultations",
+              {**crud.scope_query(clinic_doctor_email=_EMAIL), "status": "reviewed"}, NEWEST_FIRST),
+        _find("cardiologist list", "consultations", crud.scope_query(cardiologist_email=_EMAIL), NEWEST_FIRST),
+        _find("claim filter", "consultations", queue["unassigned"]),
+        _find("queue assigned to me", "consultations", queue["assigned_to_me"], crud.QUEUE_SORT),
+        _find("queue unassigned", "consultations", queue["unassigned"], crud.QUEUE_SORT),
+        _find("queue assigned to others", "consultations", queue["assigned_to_others"], crud.QUEUE_SORT,
+              crud.QUEUE_ORDER_INDEX),
+        _find("messages", "consultation_messages", {"consultation_id": "CON-00000000"}, crud.MESSAGE_SORT),
+        # Later pages add the cursor's $or (nested under $and next to the cardiologist's own $or)
+        _find("consultation list by status, next page", "consultations",
+              _next_page({"status": "pending"}), NEWEST_FIRST),
+        _find("GP list, next page", "consultations",
+              _next_page(crud.scope_query(clinic_doctor_email=_EMAIL)), NEWEST_FIRST),
+        _find("cardiologist list, next page", "consultations",
+              _next_page(crud.scope_query(cardiologist_email=_EMAIL)), NEWEST_FIRST),
+        _find("messages, next page", "consultation_messages",
+              _next_page({"consultation_id": "CON-00000000"}, ascending=True), crud.MESSAGE_SORT),
+        _find("doctor by email", "doctors", {"email": _EMAIL}),
+        _find("doctors by role", "doctors", {"role": "cardiologist"}, crud.DOCTOR_NAME_SORT),
+        _find("counters", "counters", {"scope": {"$in": [f"gp:{_EMAIL}", "unassigned"]}}),
+    ]
+
+def aggregate_shapes() -> list:
+    """Aggregation shapes: name, collection and pipeline.
+
+    Unscoped statistics and the counter rebuild read every consultation by design and are not listed.
+    """
+    return [
+        {"name": "GP statistics", "collection": "consultations",
+         "pipeline": crud.statistics_pipeline(crud.scope_query(clinic_doctor_email=_EMAIL))},
+        {"name": "cardiologist statistics", "collection": "consultations",
+         "pipeline": crud.statistics_pipeline(crud.scope_query(cardiologist_email=_EMAIL))},
+    ]
+
+async def sync_indexes():
+    """Create every catalogue index and drop the ones it supersedes"""
+    db = get_db()
+    for collection, indexes in INDEX_CATALOGUE.items():
+        await db[collection].create_indexes(indexes)
+    for collection, names in REDUNDANT_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree (classic and SBE layouts)"""
+    if isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+        return
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "innerStage", "outerStage", "queryPlan", "inputStages"):
+        yield from _plan_stages(plan.get(key))
+
+def _winning_plans(explain):
+    """Every winningPlan in an explain document, however deeply the pipeline nests it"""
+    if isinstance(explain, list):
+        for item in explain:
+            yield from _winning_plans(item)
+    elif isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+
+def _aggregate_stages(explain: dict):
+    """Pipeline stages that run after the initial cursor (e.g. a $sort the index did not cover)"""
+    for stage in explain.get("stages", []):
+        yield from (name for name in stage if name != "$cursor")
+
+async def explain_shapes() -> dict:
+    """Explain every find and aggregation shape; returns {shape name: set of plan stages}"""
+    db = get_db()
+    plans = {}
+    for shape in query_shapes():
+        cursor = db[shape["collection"]].find(shape["query"])
+        if shape["sort"]:
+            cursor = cursor.sort(shape["sort"])
+        if shape["hint"]:
+            cursor = cursor.hint(shape["hint"])
+        explain = await cursor.explain()
+        plans[shape["name"]] = set(_plan_stages(list(_winning_plans(explain))))
+    for shape in aggregate_shapes():
+        explain = await db.command("aggregate", shape["collection"], pipeline=shape["pipeline"], explain=True)
+        stages = set(_plan_stages(list(_winning_plans(explain))))
+        if "$sort" in set(_aggregate_stages(explain)):
+            stages.add("SORT")
+        plans[shape["name"]] = stages
+    return plans
+
+async def check_query_plans():
+    """Explain every shape; returns a list of (shape name, offending stage) problems"""
+    plans = await explain_shapes()
+    return [
+        (name, stage)
+        for name, stages in plans.items()
+        for stage in sorted(stages & {"COLLSCAN", "SORT"})
+    ]
@@ -3,29 +3,63 @@ GPLink - FastAPI Backend with Swagger
 Main API server for GPLink consultation system
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, BackgroundTasks, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from models import (
-    Doctor, DoctorUpdate, DoctorLogin, ConsultationRequest, ConsultationResponse,
-    ConsultationStatus, DoctorRole
+    Doctor, DoctorUpdate, DoctorLogin, ConsultationRequest, ConsultationPatch, ConsultationResponse,
+    ConsultationStatus, DoctorRole, FollowupMessage, BulkDeleteRequest
 )
 from passlib.context import CryptContext
-from database import doctors_collection, consultations_collection
+from contextlib import asynccontextmanager
+import database
+import migrations
 import crud
+import export
+import importer
+import http_cache
+import response_cache
+import directory
+import bootstrap
+import uploads
+import blobstore
+import renditions
+import sweeper
+from serialization import ORJSONResponse
+from compression import CompressionMiddleware
 from ai_analysis import analyze_medical_image
-from typing import List, Optional
-from pathlib import Path
+from typing import Annotated, List, Optional
+from datetime import datetime
+import asyncio
 import json
+import os
 
 # Password hashing context with truncate_error=False to auto-truncate long passwords
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__truncate_error=False)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Apply pending migrations, load the doctor directory and schedule the upload sweep; clean up on shutdown"""
+    applied = await migrations.apply_migrations()
+    if applied:
+        print(f"✅ Applied migrations: {applied}")
+    await directory.load()
+    # Build the response cache now so a misconfigured backend fails startup, not the first request
+    response_cache.get_cache()
+    sweep_task = sweeper.start()
+    yield
+    if sweep_task:
+        sweep_task.cancel()
+    importer.shutdown_pool()
+    await response_cache.close()
+    database.close()
+
 app = FastAPI(
     title="GPLink API",
     description="Consultation system connecting clinic doctors with cardiologists",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Enable CORS for Streamlit
@@ -37,23 +71,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount uploads directory for serving images
-UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
+# Oversized image uploads are refused from Content-Length, before the form is read
+app.add_middleware(uploads.UploadSizeLimitMiddleware)
+
+# Brotli/gzip for JSON and export bodies above the threshold (bytes)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+)
 
 # ============= DOCTORS ENDPOINTS =============
 
 @app.post("/api/doctors/register", tags=["Doctors"])
-def register_doctor(doctor: Doctor):
+async def register_doctor(doctor: Doctor):
     """Register a new doctor (clinic doctor or cardiologist)"""
     try:
         import bcrypt
         from pymongo.errors import DuplicateKeyError
         
-        # Manually hash with bcrypt - truncate to 72 bytes
+        # Manually hash with bcrypt - truncate to 72 bytes (off the event loop, bcrypt is slow)
         password_bytes = doctor.password.encode('utf-8')[:72]
-        hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+        hashed = await asyncio.to_thread(bcrypt.hashpw, password_bytes, bcrypt.gensalt())
         hashed_password = hashed.decode('utf-8')
         
         # Prepare doctor data with hashed password
@@ -61,9 +99,9 @@ def register_doctor(doctor: Doctor):
         doctor_data["password"] = hashed_password
         
         # Save to database
-        result = doctors_collection.insert_one(doctor_data)
+        doctor_id = await crud.insert_doctor(doctor_data)
         
-        return {"message": "Doctor registered successfully", "doctor_id": str(result.inserted_id)}
+        return {"message": "Doctor registered successfully", "doctor_id": doctor_id}
     except DuplicateKeyError:
         # Email already exists - return special error for frontend to handle
         raise HTTPException(
@@ -76,11 +114,11 @@ def register_doctor(doctor: Doctor):
         raise HTTPException(status_code=500, detail=f"Registration error: {str(e)}")
 
 @app.post("/api/doctors/login", tags=["Doctors"])
-def login_doctor(login_data: DoctorLogin):
+async def login_doctor(login_data: DoctorLogin):
     """Authenticate doctor and return user information"""
     import bcrypt
     
-    doctor = crud.get_doctor_by_email(login_data.email)
+    doctor = await crud.get_doctor_by_email(login_data.email)
     if not doctor:
         raise HTTPException(status_code=404, detail="Email not found")
     
@@ -88,7 +126,7 @@ def login_doctor(login_data: DoctorLogin):
     password_bytes = login_data.password.encode('utf-8')
     stored_hash = doctor.get("password", "").encode('utf-8')
     
-    if not bcrypt.checkpw(password_bytes, stored_hash):
+    if not await asyncio.to_thread(bcrypt.checkpw, password_bytes, stored_hash):
         raise HTTPException(status_code=401, detail="Incorrect password")
     
     # Remove password from response
@@ -99,59 +137,58 @@ def login_doctor(login_data: DoctorLogin):
     }
 
 @app.get("/api/doctors", tags=["Doctors"])
-def get_all_doctors():
-    """Get all registered doctors"""
-    return crud.get_all_doctors()
+async def get_all_doctors(request: Request):
+    """Get all registered doctors (cached, supports If-None-Match)"""
+    async def load():
+        doctors = await crud.get_all_doctors()
+        return doctors, http_cache.collection_etag(doctors)
+    return await response_cache.cached_response(request, (response_cache.DOCTORS,), load)
 
 @app.get("/api/doctors/{email}", tags=["Doctors"])
-def get_doctor(email: str):
-    """Get doctor by email"""
-    doctor = crud.get_doctor_by_email(email)
-    if doctor:
-        return doctor
-    else:
-        raise HTTPException(status_code=404, detail="Doctor not found")
+async def get_doctor(email: str, request: Request):
+    """Get doctor by email (cached, supports If-None-Match)"""
+    async def load():
+        doctor = await crud.get_doctor_by_email(email, crud.PUBLIC_DOCTOR_FIELDS)
+        if not doctor:
+            raise HTTPException(status_code=404, detail="Doctor not found")
+        return doctor, http_cache.document_etag(doctor)
+    return await response_cache.cached_response(request, (response_cache.DOCTORS,), load)
 
 @app.put("/api/doctors/{email}/password", tags=["Doctors"])
-def set_doctor_password(email: str, password_data: dict):
+async def set_doctor_password(email: str, password_data: dict):
     """Set or update password for existing doctor"""
     import bcrypt
     
     # Check if doctor exists
-    doctor = crud.get_doctor_by_email(email)
+    doctor = await crud.get_doctor_by_email(email)
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
     # Hash the new password
     password = password_data.get("password", "")
     password_bytes = password.encode('utf-8')[:72]
-    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+    hashed = await asyncio.to_thread(bcrypt.hashpw, password_bytes, bcrypt.gensalt())
     hashed_password = hashed.decode('utf-8')
     
     # Update password in database
-    result = doctors_collection.update_one(
-        {"email": email},
-        {"$set": {"password": hashed_password}}
-    )
-    
-    if result.matched_count > 0:
+    if await crud.set_doctor_password(email, hashed_password):
         return {"success": True, "message": "Password set successfully"}
     else:
         return {"success": False, "message": "Password already set or no changes made"}
 
 @app.put("/api/doctors/{email}", tags=["Doctors"])
-def update_doctor(email: str, doctor: DoctorUpdate):
+async def update_doctor(email: str, doctor: DoctorUpdate):
     """Update doctor information"""
-    result = crud.update_doctor(email, doctor)
+    result = await crud.update_doctor(email, doctor)
     if result["success"]:
         return {"success": True, "message": result["message"]}
     else:
         raise HTTPException(status_code=404, detail=result["error"])
 
 @app.delete("/api/doctors/{email}", tags=["Doctors"])
-def delete_doctor(email: str):
+async def delete_doctor(email: str):
     """Delete a doctor by email"""
-    result = crud.delete_doctor(email)
+    result = await crud.delete_doctor(email)
     if result["success"]:
         return {"message": result["message"]}
     else:
@@ -159,8 +196,15 @@ def delete_doctor(email: str):
 
 # ============= CONSULTATIONS ENDPOINTS =============
 
+async def current_consultation_id(consultation_id: str) -> str:
+    """Path consultation ID, with re-keyed old-style IDs mapped to their current ID"""
+    return await crud.resolve_consultation_id(consultation_id)
+
+# Every route taking a consultation ID accepts the old-style ID too
+ConsultationId = Annotated[str, Depends(current_consultation_id)]
+
 @app.post("/api/consultations", tags=["Consultations"])
-def create_consultation(
+async def create_consultation(
     consultation: ConsultationRequest,
     clinic_doctor_email: str
 ):
@@ -173,7 +217,7 @@ def create_consultation(
     - **urgency**: normal, urgent, or emergency
     """
     consultation_data = consultation.dict()
-    result = crud.create_consultation(consultation_data, clinic_doctor_email)
+    result = await crud.create_consultation(consultation_data, clinic_doctor_email)
     
     if result["success"]:
         return {
@@ -184,49 +228,168 @@ def create_consultation(
         raise HTTPException(status_code=400, detail=result["error"])
 
 @app.get("/api/consultations", tags=["Consultations"])
-def get_consultations(status: Optional[str] = None):
+async def get_consultations(
+    request: Request,
+    status: Optional[str] = None,
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    clinic_doctor_email: Optional[str] = None,
+    cardiologist_email: Optional[str] = None,
+    view: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Get a page of consultations (newest first), optionally filtered by status
+    
+    - **status**: pending, reviewed, or completed
+    - **limit**: Page size
+    - **cursor**: `next_cursor` from the previous page
+    - **clinic_doctor_email**: Only consultations created by this GP
+    - **cardiologist_email**: Only consultations assigned to or answered by this cardiologist
+    - **view**: `summary` for list-row fields only, `full` (default) for everything
+    - **fields**: Comma-separated fields to return, e.g. `patient.name,status`
+    
+    Responses are cached per query. Supports If-None-Match: an unchanged page
+    returns 304 with no body.
+    """
+    async def load():
+        try:
+            projection = crud.build_projection(view, fields)
+            page = await crud.get_all_consultations(
+                status, limit, cursor, clinic_doctor_email, cardiologist_email, projection
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page, http_cache.collection_etag(page["items"], request.url.query, page["next_cursor"])
+    return await response_cache.cached_response(request, (response_cache.CONSULTATIONS,), load)
+
+@app.post("/api/consultations/bulk-delete", tags=["Consultations"])
+async def bulk_delete_consultations(request: BulkDeleteRequest, background_tasks: BackgroundTasks):
     """
-    Get all consultations, optionally filtered by status
+    Delete many consultations in one request
     
+    - **consultation_ids**: IDs to delete
+    - Returns: `deleted` count and a per-ID `results` map (`deleted` or `not_found`)
+    
+    Attached images are released in the background after the response is sent
+    (files are deleted once no other consultation uses them).
+    """
+    result = await crud.bulk_delete_consultations(request.consultation_ids)
+    if result["files"]:
+        background_tasks.add_task(blobstore.release_many, result["files"])
+    return {"deleted": result["deleted"], "results": result["results"]}
+
+@app.get("/api/consultations/export", tags=["Consultations"])
+async def export_consultations(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    clinic_doctor_email: Optional[str] = None,
+    cardiologist_email: Optional[str] = None
+):
+    """
+    Stream consultations as NDJSON or CSV (newest first)
+    
+    - **format**: ndjson or csv
     - **status**: pending, reviewed, or completed
+    - **created_from** / **created_to**: Creation date range (from inclusive, to exclusive)
+    - **clinic_doctor_email** / **cardiologist_email**: Only this doctor's consultations
+    
+    Rows are read from a batched cursor and written as they arrive, so memory
+    use does not grow with the size of the export.
     """
-    return crud.get_all_consultations(status)
+    consultations = crud.iter_consultations(
+        status, created_from, created_to, clinic_doctor_email, cardiologist_email
+    )
+    filename = f"consultations_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        export.FORMATTERS[format](consultations),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @app.get("/api/consultations/{consultation_id}", tags=["Consultations"])
-def get_consultation(consultation_id: str):
-    """Get specific consultation by ID"""
-    consultation = crud.get_consultation(consultation_id)
+async def get_consultation(consultation_id: str, request: Request):
+    """Get specific consultation by ID (supports If-None-Match)"""
+    consultation = await crud.get_consultation(consultation_id)
     if consultation:
-        return consultation
+        return http_cache.conditional_response(request, consultation, http_cache.document_etag(consultation))
     else:
         raise HTTPException(status_code=404, detail="Consultation not found")
 
 @app.get("/api/consultations/doctor/{email}", tags=["Consultations"])
-def get_doctor_consultations(email: str):
-    """Get all consultations created by a specific clinic doctor"""
-    return crud.get_consultations_by_clinic_doctor(email)
+async def get_doctor_consultations(
+    email: str,
+    request: Request,
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Get a page of consultations created by a specific clinic doctor
+    
+    - **view** / **fields**: Same projections as `GET /api/consultations`
+    """
+    try:
+        projection = crud.build_projection(view, fields)
+        page = await crud.get_consultations_by_clinic_doctor(email, limit, cursor, projection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    etag = http_cache.collection_etag(page["items"], request.url.query, page["next_cursor"])
+    return http_cache.conditional_response(request, page, etag)
 
 @app.put("/api/consultations/{consultation_id}", tags=["Consultations"])
-def update_consultation(consultation_id: str, consultation: ConsultationRequest):
-    """Update consultation details"""
-    result = crud.update_consultation(consultation_id, consultation.dict())
+async def update_consultation(consultation_id: ConsultationId, consultation: ConsultationRequest):
+    """Update consultation details (attached images are kept - use the upload endpoints or PATCH)"""
+    result = await crud.update_consultation(consultation_id, consultation.dict())
     if result["success"]:
         return {"message": result["message"]}
     else:
         raise HTTPException(status_code=404, detail=result["error"])
 
+@app.patch("/api/consultations/{consultation_id}", tags=["Consultations"])
+async def patch_consultation(
+    consultation_id: ConsultationId,
+    changes: ConsultationPatch,
+    view: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Partially update a consultation and return the updated document
+    
+    Only the fields sent are changed. `patient` and `vital_signs` are merged
+    key by key, so `{"vital_signs": {"heart_rate": 88}}` keeps the other vitals.
+    
+    - **view** / **fields**: Projection of the returned document, as in `GET /api/consultations`
+    """
+    try:
+        projection = crud.build_projection(view, fields)
+        consultation = await crud.patch_consultation(
+            consultation_id, changes.model_dump(exclude_unset=True), projection
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if consultation:
+        return consultation
+    else:
+        raise HTTPException(status_code=404, detail="Consultation not found")
+
 @app.delete("/api/consultations/{consultation_id}", tags=["Consultations"])
-def delete_consultation(consultation_id: str):
+async def delete_consultation(consultation_id: ConsultationId):
     """Delete a consultation by ID"""
-    result = crud.delete_consultation(consultation_id)
+    result = await crud.delete_consultation(consultation_id)
     if result["success"]:
         return {"message": result["message"]}
     else:
         raise HTTPException(status_code=404, detail=result["error"])
 
 @app.put("/api/consultations/{consultation_id}/respond", tags=["Consultations"])
-def respond_to_consultation(
-    consultation_id: str,
+async def respond_to_consultation(
+    consultation_id: ConsultationId,
     response: ConsultationResponse,
     cardiologist_email: str
 ):
@@ -243,7 +406,7 @@ def respond_to_consultation(
         "cardiologist_notes": response.cardiologist_notes
     }
     
-    result = crud.update_consultation_response(
+    result = await crud.update_consultation_response(
         consultation_id,
         response_data,
         cardiologist_email
@@ -255,9 +418,9 @@ def respond_to_consultation(
         raise HTTPException(status_code=400, detail=result["error"])
 
 @app.put("/api/consultations/{consultation_id}/complete", tags=["Consultations"])
-def complete_consultation(consultation_id: str):
+async def complete_consultation(consultation_id: ConsultationId):
     """Mark consultation as completed"""
-    result = crud.mark_consultation_completed(consultation_id)
+    result = await crud.mark_consultation_completed(consultation_id)
     
     if result["success"]:
         return {"message": result["message"]}
@@ -265,92 +428,189 @@ def complete_consultation(consultation_id: str):
         raise HTTPException(status_code=400, detail=result["error"])
 
 @app.delete("/api/consultations/{consultation_id}", tags=["Consultations"])
-def delete_consultation(consultation_id: str):
+async def delete_consultation(consultation_id: ConsultationId):
     """Delete a consultation"""
-    result = crud.delete_consultation(consultation_id)
+    result = await crud.delete_consultation(consultation_id)
     
     if result["success"]:
         return {"message": result["message"]}
     else:
         raise HTTPException(status_code=404, detail=result["error"])
 
-# ============= HEALTH CHECK =============
+@app.post("/api/consultations/{consultation_id}/messages", tags=["Consultations"])
+async def add_consultation_message(consultation_id: ConsultationId, message: FollowupMessage):
+    """
+    Append a follow-up discussion message to a consultation
+    
+    - **note**: Message text
+    - **from**: Author's name
+    - **email**: Author's email
+    """
+    created = await crud.add_consultation_message(consultation_id, message.model_dump(by_alias=True))
+    if created:
+        return created
+    else:
+        raise HTTPException(status_code=404, detail="Consultation not found")
+
+@app.get("/api/consultations/{consultation_id}/messages", tags=["Consultations"])
+async def get_consultation_messages(
+    request: Request,
+    consultation_id: ConsultationId,
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Get a page of a consultation's follow-up messages (oldest first; ETag/304 supported)"""
+    try:
+        page = await crud.get_consultation_messages(consultation_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Messages are never edited, so their IDs plus the query identify the page
+    etag = http_cache.collection_etag(page["items"], request.url.query, page["next_cursor"])
+    return http_cache.conditional_response(request, page, etag)
+
+@app.post("/api/consultations/{consultation_id}/claim", tags=["Consultations"])
+async def claim_consultation(consultation_id: ConsultationId, cardiologist_email: str):
+    """
+    Claim an unassigned pending consultation for a cardiologist
+    
+    Returns 409 if another cardiologist claimed it first.
+    """
+    result = await crud.claim_consultation(consultation_id, cardiologist_email)
+    if result["success"]:
+        return {"message": result["message"]}
+    else:
+        raise HTTPException(status_code=result["code"], detail=result["error"])
+
+@app.get("/api/cardiologists/{email}/queue", tags=["Consultations"])
+async def get_cardiologist_queue(
+    email: str,
+    limit: int = Query(crud.QUEUE_LIMIT, ge=1, le=crud.MAX_PAGE_SIZE, description="Cases per bucket")
+):
+    """
+    Get pending consultations for a cardiologist, ordered by urgency then age
+    
+    - **assigned_to_me**: Cases assigned to this cardiologist
+    - **unassigned**: Cases open to any available cardiologist
+    - **assigned_to_others**: Cases assigned to other cardiologists
+    - **counts**: Total cases in each bucket (the lists hold at most `limit` summary rows)
+    """
+    return ORJSONResponse(await crud.get_cardiologist_queue(email, limit))
+
+# ============= BULK IMPORT ENDPOINTS =============
+
+@app.post("/api/import/doctors", tags=["Import"])
+async def import_doctors(request: Request):
+    """
+    Bulk import doctors from an NDJSON request body (one `Doctor` object per line)
+    
+    Passwords are hashed in a process pool and rows are inserted in unordered
+    batches. Returns `inserted`, `failed` and a per-line `errors` report.
+    """
+    return await importer.import_doctors(request.stream())
+
+@app.post("/api/import/consultations", tags=["Import"])
+async def import_consultations(request: Request):
+    """
+    Bulk import historical consultations from an NDJSON request body
+    
+    Each line is a `ConsultationRequest` that may also carry `status`, `created_at`
+    and the cardiologist response fields. Returns a per-line `errors` report.
+    """
+    return await importer.import_consultations(request.stream())
+
+# ============= COUNTERS ENDPOINTS =============
+
+@app.get("/api/counters/{email}", tags=["Counters"])
+async def get_counters(email: str):
+    """
+    Get pre-aggregated badge counts for a doctor
+    
+    - **clinic**: Consultations created by this GP, per status
+    - **assigned**: Consultations assigned to this cardiologist, per status
+    - **unassigned**: Consultations open to any cardiologist, per status
+    """
+    return await crud.get_counters(email)
+
+@app.post("/api/counters/reconcile", tags=["Counters"])
+async def reconcile_counters():
+    """Rebuild all counters from the consultations collection"""
+    return await crud.reconcile_counters()
 
 # ============= IMAGE UPLOAD ENDPOINTS =============
 
-@app.post("/api/consultations/{consultation_id}/upload-ecg", tags=["Images"])
-async def upload_ecg(consultation_id: str, file: UploadFile = File(...)):
-    """Upload ECG image for a consultation"""
+async def save_image_upload(consultation_id: str, image_field: str, file: UploadFile, label: str,
+                            background_tasks: BackgroundTasks):
+    """Shared upload pipeline: stream + hash to staging, validate, then rename into uploads/"""
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Save file
-        filename = crud.save_uploaded_file(content, file.filename, consultation_id)
-        if not filename:
-            raise HTTPException(status_code=500, detail="Failed to save file")
-        
-        # Update consultation with ECG filename
-        consultation = crud.get_consultation(consultation_id)
-        if not consultation:
-            raise HTTPException(status_code=404, detail="Consultation not found")
-        
-        crud.consultations_collection.update_one(
-            {"consultation_id": consultation_id},
-            {"$set": {"patient.ecg_image": filename}}
-        )
-        
-        return {
-            "message": "ECG image uploaded successfully",
-            "filename": filename,
-            "url": f"/uploads/{filename}"
-        }
+        result = await uploads.save_consultation_image(consultation_id, image_field, file)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+    
+    if not result["success"]:
+        raise HTTPException(status_code=result["code"], detail=result["error"])
+    background_tasks.add_task(renditions.generate_thumbnails, result["filename"])
+    return {
+        "message": f"{label} image uploaded successfully",
+        "filename": result["filename"],
+        "url": f"/api/images/{result['filename']}",
+        "size": result["size"],
+        "sha256": result["sha256"]
+    }
+
+@app.post("/api/consultations/{consultation_id}/upload-ecg", tags=["Images"])
+async def upload_ecg(consultation_id: ConsultationId, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Upload ECG image for a consultation (max MAX_UPLOAD_MB, 413 if larger)"""
+    return await save_image_upload(consultation_id, "ecg_image", file, "ECG", background_tasks)
 
 @app.post("/api/consultations/{consultation_id}/upload-xray", tags=["Images"])
-async def upload_xray(consultation_id: str, file: UploadFile = File(...)):
-    """Upload X-Ray image for a consultation"""
-    try:
-        # Read file content
-        content = await file.read()
-        
-        # Save file
-        filename = crud.save_uploaded_file(content, file.filename, consultation_id)
-        if not filename:
-            raise HTTPException(status_code=500, detail="Failed to save file")
-        
-        # Update consultation with X-Ray filename
-        consultation = crud.get_consultation(consultation_id)
-        if not consultation:
-            raise HTTPException(status_code=404, detail="Consultation not found")
-        
-        crud.consultations_collection.update_one(
-            {"consultation_id": consultation_id},
-            {"$set": {"patient.xray_image": filename}}
-        )
-        
-        return {
-            "message": "X-Ray image uploaded successfully",
-            "filename": filename,
-            "url": f"/uploads/{filename}"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def upload_xray(consultation_id: ConsultationId, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Upload X-Ray image for a consultation (max MAX_UPLOAD_MB, 413 if larger)"""
+    return await save_image_upload(consultation_id, "xray_image", file, "X-Ray", background_tasks)
 
 @app.get("/api/images/{filename}", tags=["Images"])
-async def get_image(filename: str):
-    """Get uploaded image file"""
-    file_path = crud.get_file_path(filename)
-    if file_path.exists():
-        return FileResponse(file_path)
-    else:
+@app.get("/uploads/{filename}", include_in_schema=False)
+async def get_image(filename: str, request: Request):
+    """Get uploaded image file (ETag/304, Range requests; cached for a year when content-addressed)"""
+    if not blobstore.is_valid_name(filename):
+        raise HTTPException(status_code=404, detail="Image not found")
+    file_path = blobstore.file_path(filename)
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    if blobstore.is_blob_name(filename):
+        # The name is the SHA-256 of the content, so it is a strong ETag by construction
+        return http_cache.file_response(request, file_path, f'"{filename.split(".")[0]}"', immutable=True)
+    return http_cache.file_response(request, file_path, http_cache.file_etag(file_path))
+
+@app.get("/api/images/{filename}/thumb", tags=["Images"])
+async def get_image_thumbnail(
+    filename: str,
+    request: Request,
+    w: int = Query(400, ge=1, le=4096, description="Wanted width; snapped up to 160, 400 or 800"),
+    format: str = Query(renditions.DEFAULT_FORMAT, pattern="^(webp|jpeg)$")
+):
+    """Get a downscaled preview of an uploaded image (rendered once, then served from disk)"""
+    if not blobstore.is_valid_name(filename):
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        path = await renditions.get_rendition(filename, w, format)
+    except renditions.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image has too many pixels to render")
+    except OSError:
+        raise HTTPException(status_code=415, detail="Image could not be decoded")
+    if path is None:
         raise HTTPException(status_code=404, detail="Image not found")
+    media_type = renditions.RENDITION_FORMATS[format][2]
+    if blobstore.is_blob_name(filename):
+        # Renditions of a content-addressed image are derived from it, so they never change either
+        return http_cache.file_response(request, path, f'"{path.name}"', immutable=True, media_type=media_type)
+    return http_cache.file_response(request, path, http_cache.file_etag(path), media_type=media_type)
 
 # ============= AI ANALYSIS ENDPOINTS =============
 
 @app.post("/api/consultations/{consultation_id}/analyze-image", tags=["AI Analysis"])
-def analyze_consultation_image(consultation_id: str, image_type: str):
+async def analyze_consultation_image(consultation_id: ConsultationId, image_type: str):
     """
     Analyze medical image (ECG or X-Ray) using AI
     
@@ -359,7 +619,7 @@ def analyze_consultation_image(consultation_id: str, image_type: str):
     """
     try:
         # Get consultation
-        consultation = crud.get_consultation(consultation_id)
+        consultation = await crud.get_consultation(consultation_id)
         if not consultation:
             raise HTTPException(status_code=404, detail="Consultation not found")
         
@@ -381,15 +641,16 @@ def analyze_consultation_image(consultation_id: str, image_type: str):
         if not image_path.exists():
             raise HTTPException(status_code=404, detail="Image file not found")
         
-        # Analyze image using AI
-        analysis = analyze_medical_image(str(image_path), image_type)
+        # Analyze image using AI (identical images share one analysis, keyed by content hash)
+        analysis = await blobstore.get_analysis(image_filename, image_type.lower())
+        if analysis is None:
+            analysis = await asyncio.to_thread(analyze_medical_image, str(image_path), image_type)
+            if not analysis.startswith("Error"):
+                await blobstore.save_analysis(image_filename, image_type.lower(), analysis)
         
         # Save analysis to consultation
         field_name = f"ecg_analysis" if image_type.lower() == "ecg" else f"xray_analysis"
-        crud.consultations_collection.update_one(
-            {"consultation_id": consultation_id},
-            {"$set": {field_name: analysis}}
-        )
+        await crud.save_image_analysis(consultation_id, field_name, analysis)
         
         return {
             "image_type": image_type,
@@ -405,7 +666,7 @@ def analyze_consultation_image(consultation_id: str, image_type: str):
 # ============= HEALTH CHECK =============
 
 @app.get("/", tags=["Health"])
-def health_check():
+async def health_check():
     """API health check"""
     return {
         "status": "healthy",
@@ -414,20 +675,60 @@ def health_check():
     }
 
 @app.get("/api/stats", tags=["Statistics"])
-def get_statistics():
-    """Get system statistics"""
-    all_consultations = crud.get_all_consultations()
-    pending = len([c for c in all_consultations if c["status"] == "pending"])
-    reviewed = len([c for c in all_consultations if c["status"] == "reviewed"])
-    completed = len([c for c in all_consultations if c["status"] == "completed"])
+async def get_statistics(
+    request: Request,
+    clinic_doctor_email: Optional[str] = None,
+    cardiologist_email: Optional[str] = None
+):
+    """
+    Get system statistics, optionally scoped to one doctor
     
-    return {
-        "total_consultations": len(all_consultations),
-        "pending": pending,
-        "reviewed": reviewed,
-        "completed": completed,
-        "total_doctors": len(crud.get_all_doctors())
-    }
+    - **clinic_doctor_email**: Only count consultations created by this GP
+    - **cardiologist_email**: Only count consultations assigned to or answered by this cardiologist
+    """
+    async def load():
+        return await crud.get_statistics(clinic_doctor_email, cardiologist_email), None
+    return await response_cache.cached_response(
+        request, (response_cache.CONSULTATIONS, response_cache.DOCTORS), load
+    )
+
+# ============= PAGE BOOTSTRAP =============
+
+@app.get("/api/bootstrap/{page}", tags=["Bootstrap"])
+async def get_page_bootstrap(
+    page: str,
+    request: Request,
+    user: str = Query(..., description="Email of the logged-in doctor"),
+    status: Optional[str] = None
+):
+    """
+    Everything one frontend page needs, fetched concurrently in a single call
+    
+    Every bundle has `user` and sidebar `counters`, plus per page:
+    - **home**: global `stats`
+    - **new-consultation**: `cardiologists` for the assignment picker
+    - **consultations**: first page of the user's `consultations` (filtered by **status**)
+    - **respond**: the cardiologist `queue`
+    - **statistics**: role-scoped `stats` and summary `consultations`
+    - **doctors**: all `doctors`
+    - **sidebar**: nothing extra
+    """
+    async def load():
+        try:
+            bundle = await bootstrap.build_bundle(page, user, status)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown page: {page}")
+        if bundle is None:
+            raise HTTPException(status_code=404, detail="Doctor not found")
+        return bundle, None
+    return await response_cache.cached_response(
+        request, (response_cache.CONSULTATIONS, response_cache.DOCTORS), load
+    )
+
+@app.get("/api/metrics/cache", tags=["Statistics"])
+async def get_cache_metrics():
+    """Response cache hit ratio and time saved for this worker process"""
+    return response_cache.metrics()
 
 if __name__ == "__main__":
     import uvicorn
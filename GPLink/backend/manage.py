@@ -0,0 +1,91 @@
+"""
+GPLink - Management Commands
+Maintenance tasks run from the backend directory, e.g. `python manage.py migrate`
+"""
+
+import argparse
+import asyncio
+import sys
+import database
+import migrations
+import indexes
+import crud
+import sweeper
+
+async def reconcile_counters(args):
+    """Rebuild the counters collection from scratch"""
+    result = await crud.reconcile_counters()
+    print(f"✅ Rebuilt {result['counters']} counters")
+
+async def migrate(args):
+    """Apply pending database migrations"""
+    applied = await migrations.apply_migrations()
+    print(f"✅ Applied migrations: {applied}" if applied else "✅ Database is up to date")
+
+async def rekey_consultations(args):
+    """Move old random-hex consultation IDs to time-ordered IDs"""
+    result = await crud.rekey_legacy_consultations()
+    print(f"✅ Re-keyed {result['rekeyed']} consultations")
+
+async def adopt_uploads(args):
+    """Move per-consultation image files into the content-addressed blob store"""
+    result = await crud.adopt_legacy_uploads()
+    print(f"✅ Adopted {result['adopted']} images into the blob store ({result['missing']} files missing)")
+
+async def sweep_uploads(args):
+    """Quarantine or delete upload files no consultation refers to"""
+    report = await sweeper.sweep(mode=args.mode, dry_run=args.dry_run, reconcile=args.reconcile_refcounts)
+    if not report["success"]:
+        print(f"❌ {report['error']}")
+        sys.exit(1)
+    prefix = "Dry run - " if args.dry_run else ""
+    print(f"✅ {prefix}scanned {report['scanned']} files in {report['elapsed_ms']} ms; {sweeper.summary(report)}")
+
+async def check_indexes(args):
+    """Fail if any API query shape needs a collection scan or in-memory sort"""
+    problems = await indexes.check_query_plans()
+    for shape, stage in problems:
+        print(f"❌ {stage}: {shape}")
+    if problems:
+        sys.exit(1)
+    print(f"✅ All {len(indexes.query_shapes()) + len(indexes.aggregate_shapes())} query shapes are index-backed")
+
+async def run(args):
+    """Run a command, closing the database client afterwards"""
+    try:
+        await args.func(args)
+    finally:
+        database.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="GPLink management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    migrate_cmd = subparsers.add_parser("migrate", help="Apply pending database migrations")
+    migrate_cmd.set_defaults(func=migrate)
+    
+    reconcile = subparsers.add_parser("reconcile-counters", help="Rebuild badge counters from consultations")
+    reconcile.set_defaults(func=reconcile_counters)
+    
+    rekey = subparsers.add_parser("rekey-consultations", help="Give legacy CON-XXXXXXXX consultations time-ordered IDs")
+    rekey.set_defaults(func=rekey_consultations)
+    
+    adopt = subparsers.add_parser("adopt-uploads", help="Move legacy uploads into the deduplicated blob store")
+    adopt.set_defaults(func=adopt_uploads)
+    
+    sweep = subparsers.add_parser("sweep-uploads", help="Find upload files nothing refers to and quarantine or delete them")
+    sweep.add_argument("--mode", choices=sweeper.SWEEP_MODES, default=sweeper.sweep_mode,
+                       help="Move orphans to uploads/.quarantine (default) or delete them")
+    sweep.add_argument("--dry-run", action="store_true", help="Report orphans without touching them")
+    sweep.add_argument("--reconcile-refcounts", action="store_true",
+                       help="Also correct blob reference counts that disagree with consultations")
+    sweep.set_defaults(func=sweep_uploads)
+    
+    check = subparsers.add_parser("check-indexes", help="Explain every API query shape and fail on COLLSCAN or SORT")
+    check.set_defaults(func=check_indexes)
+    
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+GPLink - Database Migrations
+Versioned schema/index changes, each applied once and recorded in `_migrations`
+"""
+
+from database import (
+    consultations_collection, doctors_collection, counters_collection, messages_collection,
+    migrations_collection
+)
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import asyncio
+import os
+import indexes
+
+load_dotenv()
+
+# A claim not renewed for this long belongs to a dead worker and may be taken over
+MIGRATION_LEASE = timedelta(minutes=int(os.getenv("MIGRATION_LEASE_MINUTES", "10")))
+MIGRATION_POLL_SECONDS = 2
+
+async def initial_indexes():
+    """Indexes for lookups, keyset pagination, counters and the cardiologist queue"""
+    await consultations_collection().create_index("consultation_id", unique=True)
+    await consultations_collection().create_index("status")
+    await doctors_collection().create_index("email", unique=True)
+    await counters_collection().create_index([("scope", 1), ("status", 1)], unique=True)
+    
+    # Compound indexes backing keyset pagination on (created_at, _id)
+    await consultations_collection().create_index([("created_at", -1), ("_id", -1)])
+    await consultations_collection().create_index([("status", 1), ("created_at", -1), ("_id", -1)])
+    await consultations_collection().create_index([("clinic_doctor_email", 1), ("created_at", -1), ("_id", -1)])
+    
+    # Cardiologist work queue and claim filter
+    await consultations_collection().create_index([("status", 1), ("assigned_cardiologist_email", 1)])
+
+async def index_catalogue():
+    """Sync indexes with the declared catalogue in indexes.py"""
+    await indexes.sync_indexes()
+
+async def followup_notes_to_messages():
+    """Move embedded followup_notes arrays into the consultation_messages collection"""
+    await indexes.sync_indexes()
+    
+    async for consultation in consultations_collection().find(
+        {"followup_notes": {"$exists": True}},
+        {"consultation_id": 1, "created_at": 1, "followup_notes": 1}
+    ):
+        notes = consultation.get("followup_notes") or []
+        messages = []
+        for note in notes:
+            try:
+                created_at = datetime.fromisoformat(note["timestamp"].replace("Z", "+00:00")).replace(tzinfo=None)
+            except (KeyError, AttributeError, ValueError):
+                created_at = consultation["created_at"]
+            messages.append({
+                "consultation_id": consultation["consultation_id"],
+                "note": note.get("note"),
+                "from": note.get("from"),
+                "email": note.get("email"),
+                "created_at": created_at
+            })
+        if messages:
+            await messages_collection().insert_many(messages)
+        
+        await consultations_collection().update_one(
+            {"_id": consultation["_id"]},
+            {
+                "$set": {
+                    "message_count": len(messages),
+                    "last_activity_at": max([m["created_at"] for m in messages] + [consultation["created_at"]])
+                },
+                "$unset": {"followup_notes": ""}
+            }
+        )
+
+async def legacy_id_index():
+    """Index legacy_consultation_id so re-keyed consultations resolve by their old ID"""
+    await indexes.sync_indexes()
+
+async def document_versions():
+    """Backfill version/updated_at on documents created before ETag support"""
+    for collection in (consultations_collection(), doctors_collection()):
+        await collection.update_many(
+            {"version": {"$exists": False}},
+            [{"$set": {"version": 1, "updated_at": {"$ifNull": ["$updated_at", "$created_at"]}}}]
+        )
+
+async def queue_urgency_rank():
+    """Store urgency_rank on consultations and index the cardiologist queue order"""
+    await consultations_collection().update_many(
+        {"urgency_rank": {"$exists": False}},
+        [{"$set": {"urgency_rank": {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$urgency", "emergency"]}, "then": 0},
+                {"case": {"$eq": ["$urgency", "urgent"]}, "then": 1},
+                {"case": {"$eq": ["$urgency", "normal"]}, "then": 2}
+            ],
+            "default": 3
+        }}}}]
+    )
+    await indexes.sync_indexes()
+
+async def doctor_role_index():
+    """Index doctors by (role, name) for the cardiologist picker"""
+    await indexes.sync_indexes()
+
+# Ordered list of (version, migration). Never renumber or edit an applied
+# migration - add a new one instead.
+MIGRATIONS = [
+    (1, initial_indexes),
+    (2, index_catalogue),
+    (3, followup_notes_to_messages),
+    (4, legacy_id_index),
+    (5, document_versions),
+    (6, queue_urgency_rank),
+    (7, doctor_role_index),
+]
+
+async def _claim(version: int, migration) -> bool:
+    """Claim a version for this worker: a fresh claim, or one whose lease has run out"""
+    now = datetime.now()
+    try:
+        await migrations_collection().insert_one({
+            "_id": version,
+            "name": migration.__name__,
+            "description": migration.__doc__,
+            "started_at": now,
+            "lease_until": now + MIGRATION_LEASE,
+            "pid": os.getpid(),
+            "applied_at": None
+        })
+        return True
+    except DuplicateKeyError:
+        pass
+    # The previous runner died mid-migration; claims from before leases expire by started_at
+    stale = await migrations_collection().find_one_and_update(
+        {
+            "_id": version,
+            "applied_at": None,
+            "$or": [
+                {"lease_until": {"$lt": now}},
+                {"lease_until": {"$exists": False}, "started_at": {"$lt": now - MIGRATION_LEASE}}
+            ]
+        },
+        {"$set": {"started_at": now, "lease_until": now + MIGRATION_LEASE, "pid": os.getpid()}}
+    )
+    if stale:
+        print(f"❌ Reclaiming migration {version} ({migration.__name__}) abandoned by pid {stale.get('pid')}")
+    return stale is not None
+
+async def _renew_lease(version: int):
+    """Keep extending a claim while its migration runs"""
+    while True:
+        await asyncio.sleep(MIGRATION_LEASE.total_seconds() / 3)
+        await migrations_collection().update_one(
+            {"_id": version, "pid": os.getpid(), "applied_at": None},
+            {"$set": {"lease_until": datetime.now() + MIGRATION_LEASE}}
+        )
+
+async def apply_migrations():
+    """
+    Apply every migration not yet recorded in `_migrations`, in order; returns versions applied.
+
+    A version another worker is running is waited for rather than skipped, so no later
+    migration (or app startup) runs before it is applied. Claims carry a lease renewed
+    while the migration runs; a claim whose lease has lapsed is taken over.
+    """
+    applied = []
+    for version, migration in MIGRATIONS:
+        while True:
+            record = await migrations_collection().find_one({"_id": version}, {"applied_at": 1})
+            if record and record.get("applied_at"):
+                break
+            if await _claim(version, migration):
+                renewal = asyncio.create_task(_renew_lease(version))
+                try:
+                    await migration()
+                except Exception:
+                    # Release the claim so the next start retries it
+                    await migrations_collection().delete_one({"_id": version, "pid": os.getpid()})
+                    raise
+                finally:
+                    renewal.cancel()
+                await migrations_collection().update_one(
+                    {"_id": version},
+                    {"$set": {"applied_at": datetime.now()}, "$unset": {"lease_until": ""}}
+                )
+                applied.append(version)
+                break
+            # Claimed by a live worker: wait for it to finish (or for its lease to lapse)
+            await asyncio.sleep(MIGRATION_POLL_SECONDS)
+    return applied
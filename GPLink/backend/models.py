@@ -3,7 +3,7 @@ GPLink - Data Models
 Pydantic schemas for data validation
 """
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -61,7 +61,72 @@ class ConsultationRequest(BaseModel):
     lab_remarks: Optional[str] = None  # GP's remarks about lab results
     image_remarks: Optional[str] = None  # GP's remarks about medical images
     provisional_diagnosis: Optional[str] = None  # GP's provisional diagnosis
-    followup_notes: Optional[List[dict]] = []  # Follow-up discussion notes
+    followup_notes: Optional[List[dict]] = []  # Initial follow-up notes, stored as consultation messages
+
+class ConsultationImport(ConsultationRequest):
+    """A historical consultation for bulk import - may already be answered"""
+    status: ConsultationStatus = ConsultationStatus.PENDING
+    created_at: Optional[datetime] = None
+    diagnosis: Optional[str] = None
+    recommendations: Optional[str] = None
+    cardiologist_notes: Optional[str] = None
+    cardiologist_email: Optional[EmailStr] = None
+    response_date: Optional[datetime] = None
+
+class FollowupMessage(BaseModel):
+    """A follow-up discussion message appended to a consultation"""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    note: str
+    from_name: str = Field(alias="from")  # Author's display name
+    email: EmailStr
+
+def reject_null(value):
+    """Fields that may be left out of a PATCH but never cleared with an explicit null"""
+    if value is None:
+        raise ValueError("may be omitted but not set to null")
+    return value
+
+class PatientInfoPatch(BaseModel):
+    """Partial patient info for PATCH - only the fields sent are changed"""
+    name: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = None
+    ic_number: Optional[str] = None
+    ecg_image: Optional[str] = None  # Send null to remove the ECG image
+    xray_image: Optional[str] = None  # Send null to remove the X-Ray image
+    
+    @field_validator("name", "age", "gender", "ic_number")
+    @classmethod
+    def not_null(cls, value):
+        return reject_null(value)
+    
+    @field_validator("ecg_image", "xray_image")
+    @classmethod
+    def removal_only(cls, value):
+        # Images are reference-counted blobs attached only by the upload endpoints
+        if value is not None:
+            raise ValueError("can only be set to null (upload images via the upload endpoints)")
+        return value
+
+class ConsultationPatch(BaseModel):
+    """Partial consultation update - patient and vital_signs are merged, other fields replaced"""
+    patient: Optional[PatientInfoPatch] = None
+    symptoms: Optional[str] = None
+    vital_signs: Optional[dict] = None
+    urgency: Optional[str] = None
+    lab_investigations: Optional[List[dict]] = None
+    lab_remarks: Optional[str] = None
+    image_remarks: Optional[str] = None
+    provisional_diagnosis: Optional[str] = None
+    
+    @field_validator("patient", "symptoms", "vital_signs", "urgency")
+    @classmethod
+    def not_null(cls, value):
+        return reject_null(value)
+
+class BulkDeleteRequest(BaseModel):
+    consultation_ids: List[str] = Field(..., min_length=1, max_length=1000)
 
 class ConsultationResponse(BaseModel):
     consultation_id: str
@@ -96,8 +161,9 @@ class Consultation(BaseModel):
     # GP's provisional diagnosis
     provisional_diagnosis: Optional[str] = None  # GP's initial diagnosis before cardio review
     
-    # Follow-up discussion
-    followup_notes: Optional[List[dict]] = []  # Follow-up notes from GP/Cardiologist
+    # Follow-up discussion (messages themselves live in consultation_messages)
+    message_count: int = 0
+    last_activity_at: Optional[datetime] = None
     
     # AI Analysis fields
     ecg_analysis: Optional[str] = None  # AI analysis of ECG image
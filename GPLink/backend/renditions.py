@@ -0,0 +1,82 @@
+"""
+GPLink - Image Renditions
+Pillow thumbnails of stored ECG/X-ray images at a few fixed widths, cached on disk
+"""
+
+from PIL import Image, ImageOps
+import asyncio
+import os
+import tempfile
+import blobstore
+
+# Requested widths snap up to one of these, so the cache holds a bounded set of files
+THUMB_WIDTHS = (160, 400, 800)
+
+# format query value -> (Pillow format, file extension, media type, save options)
+RENDITION_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Generated for every upload; other sizes/formats are rendered on first request
+DEFAULT_FORMAT = "webp"
+
+# Pillow refuses images over twice Image.MAX_IMAGE_PIXELS with this (not an OSError)
+DecompressionBombError = Image.DecompressionBombError
+
+def snap_width(width: int) -> int:
+    """Smallest configured width that is at least the requested one"""
+    for candidate in THUMB_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return THUMB_WIDTHS[-1]
+
+def rendition_path(name: str, width: int, fmt: str):
+    stem = blobstore.rendition_stem(name)
+    return stem.parent / f"{stem.name}_w{width}.{RENDITION_FORMATS[fmt][1]}"
+
+def _render(source, destination, width: int, fmt: str):
+    """Resize source to at most `width` pixels wide and write it atomically (blocking)"""
+    pillow_format, _, _, options = RENDITION_FORMATS[fmt]
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if pillow_format == "JPEG" and image.mode != "RGB":
+            # JPEG has no alpha channel; flatten onto white like the UI background
+            background = Image.new("RGB", image.size, "white")
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=destination.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                image.save(out, pillow_format, **options)
+            os.replace(temp_path, destination)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+async def get_rendition(name: str, width: int, fmt: str = DEFAULT_FORMAT):
+    """Path to a cached thumbnail, rendering it first if needed; None if the image does not exist"""
+    destination = rendition_path(name, snap_width(width), fmt)
+    if destination.exists():
+        return destination
+    source = blobstore.file_path(name)
+    if not source.exists():
+        return None
+    await asyncio.to_thread(_render, source, destination, snap_width(width), fmt)
+    return destination
+
+async def generate_thumbnails(name: str):
+    """Pre-render the default-format thumbnails for a new upload (run as a background task)"""
+    for width in THUMB_WIDTHS:
+        try:
+            await get_rendition(name, width)
+        except Exception as e:
+            print(f"Error rendering {width}px thumbnail for {name}: {e}")
+            return
@@ -0,0 +1,281 @@
+"""
+GPLink - Response Cache
+Caches rendered GET responses by route and query; crud writes invalidate them by tag
+"""
+
+from fastapi import Request
+from collections import OrderedDict
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+import http_cache
+import serialization
+import hashlib
+import os
+import time
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Only needed for RESPONSE_CACHE_BACKEND=redis
+    redis = None
+
+load_dotenv()
+
+# uvicorn and gunicorn both take their worker count from WEB_CONCURRENCY when --workers is not given
+worker_count = int(os.getenv("WEB_CONCURRENCY", "1"))
+# The memory backend's invalidations only reach its own worker; several workers share Redis by default
+backend_name = os.getenv("RESPONSE_CACHE_BACKEND") or ("redis" if worker_count > 1 else "memory")
+ttl_seconds = int(os.getenv("RESPONSE_CACHE_TTL", "30"))
+max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+redis_url = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Invalidation tags - a cached response lists the collections it was built from
+DOCTORS = "doctors"
+CONSULTATIONS = "consultations"
+
+class MemoryBackend:
+    """
+    LRU with per-entry TTL, private to this worker process.
+
+    Invalidation generations are per process too: with several workers, a write handled by
+    one leaves the others serving their cached copy for up to RESPONSE_CACHE_TTL seconds.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        if worker_count > 1:
+            raise RuntimeError(
+                f"RESPONSE_CACHE_BACKEND=memory cannot invalidate across {worker_count} workers "
+                "(WEB_CONCURRENCY); use redis or none"
+            )
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        self._generations = {}  # tag -> number of invalidations so far
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    async def generation(self, tags: frozenset):
+        return tuple(self._generations.get(tag, 0) for tag in sorted(tags))
+
+    async def set(self, key: str, value: bytes, tags: frozenset, ttl: int, generation) -> bool:
+        # No await between the check and the store, so an invalidation cannot slip in
+        if await self.generation(tags) != generation:
+            return False
+        self._entries[key] = (time.monotonic() + ttl, tags, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    async def invalidate(self, tags: frozenset):
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        for key in [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]:
+            del self._entries[key]
+
+    async def close(self):
+        self._entries.clear()
+
+class RedisBackend:
+    """Any Redis-protocol server, shared by every worker; each tag is a set of the keys built from it"""
+
+    name = "redis"
+    prefix = "gplink:cache:"
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis needs the `redis` package")
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str):
+        return await self._redis.get(self.prefix + key)
+
+    def _generation_keys(self, tags: frozenset) -> list:
+        return [f"{self.prefix}generation:{tag}" for tag in sorted(tags)]
+
+    async def generation(self, tags: frozenset):
+        return tuple(await self._redis.mget(self._generation_keys(tags)))
+
+    async def set(self, key: str, value: bytes, tags: frozenset, ttl: int, generation) -> bool:
+        generation_keys = self._generation_keys(tags)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            # WATCH makes EXEC fail if any worker invalidates these tags before we store
+            await pipe.watch(*generation_keys)
+            if tuple(await pipe.mget(generation_keys)) != generation:
+                await pipe.reset()
+                return False
+            pipe.multi()
+            pipe.set(self.prefix + key, value, ex=ttl)
+            for tag in tags:
+                pipe.sadd(f"{self.prefix}tag:{tag}", self.prefix + key)
+                pipe.expire(f"{self.prefix}tag:{tag}", ttl)
+            try:
+                await pipe.execute()
+            except redis.WatchError:
+                return False
+        return True
+
+    async def invalidate(self, tags: frozenset):
+        # Bump the generations, then read and clear each tag set, all atomically
+        pipe = self._redis.pipeline(transaction=True)
+        for generation_key in self._generation_keys(tags):
+            pipe.incr(generation_key)
+        for tag in tags:
+            pipe.smembers(f"{self.prefix}tag:{tag}")
+            pipe.delete(f"{self.prefix}tag:{tag}")
+        results = (await pipe.execute())[len(tags):]
+        keys = set().union(*results[::2])
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self):
+        await self._redis.aclose()
+
+class ResponseCache:
+    """Cache front end with hit/miss accounting; backend errors degrade to a miss, never a failed request"""
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        self.invalidations = 0
+        self.skipped_writes = 0
+        self.errors = 0
+
+    async def get(self, key: str):
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Response cache read failed: {e}")
+            return None
+
+    async def generation(self, tags: frozenset):
+        """Invalidation count of each tag; None if the backend could not be read"""
+        try:
+            return await self.backend.generation(tags)
+        except Exception as e:
+            self.errors += 1
+            print(f"Response cache read failed: {e}")
+            return None
+
+    async def set(self, key: str, value: bytes, tags: frozenset, generation):
+        """Store value unless one of its tags was invalidated since `generation` was read"""
+        if generation is None:
+            return
+        try:
+            if not await self.backend.set(key, value, tags, self.ttl, generation):
+                self.skipped_writes += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Response cache write failed: {e}")
+
+    async def invalidate(self, *tags: str):
+        self.invalidations += 1
+        try:
+            await self.backend.invalidate(frozenset(tags))
+        except Exception as e:
+            self.errors += 1
+            print(f"Response cache invalidation failed: {e}")
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+            "invalidations": self.invalidations,
+            # Loads that raced a write; their possibly stale body was not cached
+            "skipped_writes": self.skipped_writes,
+            "errors": self.errors
+        }
+
+# One cache per worker process, created on first use (see database.get_db)
+_cache = None
+_pid = None
+
+def get_cache():
+    """Return this process's response cache, or None when RESPONSE_CACHE_BACKEND=none"""
+    global _cache, _pid
+    if backend_name == "none":
+        return None
+    if _cache is None or _pid != os.getpid():
+        backend = RedisBackend(redis_url) if backend_name == "redis" else MemoryBackend(max_entries)
+        _cache = ResponseCache(backend, ttl_seconds)
+        _pid = os.getpid()
+    return _cache
+
+async def close():
+    """Release this worker's cache backend"""
+    global _cache
+    if _cache is not None and _pid == os.getpid():
+        await _cache.backend.close()
+    _cache = None
+
+async def invalidate(*tags: str):
+    """Drop every cached response built from any of the given tags"""
+    cache = get_cache()
+    if cache is not None:
+        await cache.invalidate(*tags)
+
+def cache_key(request: Request) -> str:
+    """Route path plus its query parameters in a stable order"""
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+def _pack(etag: str, cost_ms: float, body: bytes) -> bytes:
+    return f"{etag}\n{cost_ms:.3f}\n".encode("utf-8") + body
+
+def _unpack(value: bytes):
+    etag, cost_ms, body = value.split(b"\n", 2)
+    return etag.decode("utf-8"), float(cost_ms), body
+
+async def cached_response(request: Request, tags: tuple, load):
+    """
+    Serve a GET from the cache, or await load() -> (content, etag) and cache the rendered body.
+
+    An etag of None is derived from the body. If-None-Match is honoured on hits and misses.
+    """
+    cache = get_cache()
+    key = cache_key(request)
+    value = await cache.get(key) if cache is not None else None
+    if value is not None:
+        etag, cost_ms, body = _unpack(value)
+        cache.hits += 1
+        cache.saved_ms += cost_ms
+        return http_cache.body_response(request, body, etag)
+
+    # Read the tag generations before loading: a write that invalidates while
+    # load() runs bumps them, and the (possibly pre-write) body is then not stored
+    tags = frozenset(tags)
+    generation = await cache.generation(tags) if cache is not None else None
+    start = time.perf_counter()
+    content, etag = await load()
+    body = serialization.dumps(content)
+    cost_ms = (time.perf_counter() - start) * 1000
+    if etag is None:
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    if cache is not None:
+        cache.misses += 1
+        await cache.set(key, _pack(etag, cost_ms, body), tags, generation)
+    return http_cache.body_response(request, body, etag)
+
+def metrics() -> dict:
+    """Hit ratio and latency saved by this worker's cache"""
+    cache = get_cache()
+    if cache is None:
+        return {"backend": "none"}
+    return cache.metrics()
@@ -0,0 +1,39 @@
+"""
+GPLink - JSON Serialization
+orjson-backed responses that encode MongoDB documents (ObjectId, datetime) directly
+"""
+
+from fastapi.responses import JSONResponse
+from bson import ObjectId, Decimal128
+from decimal import Decimal
+from pydantic import BaseModel
+import orjson
+
+def bson_default(value):
+    """orjson fallback for the BSON types it does not know; datetimes are handled natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    """Serialize API content (raw Mongo documents included) to JSON bytes"""
+    return orjson.dumps(content, default=bson_default, option=orjson.OPT_NON_STR_KEYS)
+
+class ORJSONResponse(JSONResponse):
+    """
+    Default response class for the API.
+
+    Routes that return a response instance directly skip FastAPI's
+    jsonable_encoder pass entirely - use that for large lists.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,261 @@
+"""
+GPLink - Upload Sweeper
+Reconciles uploads/ with what consultations refer to: orphaned files are quarantined or deleted
+"""
+
+from database import consultations_collection, blobs_collection, jobs_collection
+from pymongo.errors import DuplicateKeyError
+from collections import Counter
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pathlib import Path
+import asyncio
+import os
+import time
+import blobstore
+import crud
+import uploads
+
+load_dotenv()
+
+# Scheduled sweep; 0 disables it (the manage.py command still works)
+interval_hours = float(os.getenv("UPLOAD_SWEEP_INTERVAL_HOURS", "24"))
+sweep_mode = os.getenv("UPLOAD_SWEEP_MODE", "quarantine")
+# Files younger than this are never touched: uploads and renders may still be in flight
+grace_minutes = int(os.getenv("UPLOAD_SWEEP_GRACE_MINUTES", "60"))
+quarantine_days = int(os.getenv("UPLOAD_QUARANTINE_DAYS", "7"))
+reconcile_refcounts = os.getenv("UPLOAD_SWEEP_RECONCILE", "0") == "1"
+
+SWEEP_MODES = ("quarantine", "delete")
+SWEEP_BATCH_SIZE = 1000
+# Workers wake this often to see whether a sweep is due
+POLL_SECONDS = 600
+JOB_ID = "upload_sweep"
+
+# Quarantined files keep their path relative to uploads/, so restoring one is a single move
+QUARANTINE_DIR = blobstore.UPLOADS_DIR / ".quarantine"
+
+# ============= REFERENCES =============
+
+async def referenced_names() -> Counter:
+    """How many consultation image fields point at each stored name, streamed in batches"""
+    references = Counter()
+    cursor = consultations_collection().find(
+        {"$or": [{f"patient.{field}": {"$nin": [None, ""]}} for field in crud.IMAGE_FIELDS]},
+        {"_id": 0, **{f"patient.{field}": 1 for field in crud.IMAGE_FIELDS}}
+    ).batch_size(SWEEP_BATCH_SIZE)
+    async for consultation in cursor:
+        references.update(crud.image_names(consultation))
+    return references
+
+async def reconcile_blobs(references: Counter, settled_before: datetime, fix: bool = False) -> dict:
+    """
+    Compare each blob's refcount with the references actually found.
+
+    With fix, blobs last acquired before settled_before get their refcount corrected;
+    a blob nothing refers to loses its document, so its file is swept as an orphan.
+    Returns the names whose files must be kept plus mismatch counts.
+    """
+    known = set()
+    mismatched = 0
+    fixed = 0
+    cursor = blobs_collection().find({}, {"refcount": 1, "acquired_at": 1}).batch_size(SWEEP_BATCH_SIZE)
+    async for blob in cursor:
+        name = blob["_id"]
+        refcount = blob.get("refcount", 0)
+        actual = references.get(name, 0)
+        if refcount != actual:
+            mismatched += 1
+            settled = (blob.get("acquired_at") or datetime.min) < settled_before
+            if fix and settled:
+                # Compare-and-set: an acquire or release since we read the blob makes this a no-op
+                match = {"_id": name, "refcount": refcount, **blobstore.LIVE_BLOB}
+                if actual == 0:
+                    if await blobs_collection().find_one_and_delete(match):
+                        fixed += 1
+                        continue
+                elif (await blobs_collection().update_one(match, {"$set": {"refcount": actual}})).modified_count:
+                    fixed += 1
+        known.add(name)
+    return {"known": known, "mismatched": mismatched, "fixed": fixed}
+
+# ============= FILESYSTEM =============
+
+def _scan(directory: Path):
+    """Every regular file below directory, yielded as found rather than listed up front"""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _scan(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+    except FileNotFoundError:
+        # Removed while we walked (e.g. a shard emptied by a release)
+        return
+
+def _find_orphans(live: set, settled_before: float, expire_before: float) -> dict:
+    """Walk uploads/ and list files nothing refers to (blocking - run in a thread)"""
+    live_keys = {blobstore.rendition_stem(name).name for name in live}
+    orphans = []
+    seen = set()
+    scanned = 0
+    for entry in _scan(blobstore.UPLOADS_DIR):
+        path = Path(entry.path)
+        relative = path.relative_to(blobstore.UPLOADS_DIR)
+        area = relative.parts[0]
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        scanned += 1
+
+        if area == QUARANTINE_DIR.name:
+            if stat.st_mtime < expire_before:
+                orphans.append(("expired", relative, stat.st_size))
+            continue
+        if area == uploads.STAGING_DIR.name:
+            kind = "staging"
+        elif area == blobstore.BLOBS_DIR.name:
+            kind = "blob"
+        elif area == blobstore.RENDITIONS_DIR.name:
+            kind = "rendition"
+        elif len(relative.parts) == 1 and not path.name.startswith("."):
+            kind = "legacy"
+        else:
+            continue
+
+        if kind in ("blob", "legacy"):
+            seen.add(path.name)
+            if path.name in live:
+                continue
+        elif kind == "rendition" and path.name.split("_w")[0] in live_keys:
+            continue
+        if stat.st_mtime >= settled_before:
+            continue
+        orphans.append((kind, relative, stat.st_size))
+    return {"orphans": orphans, "seen": seen, "scanned": scanned}
+
+def _dispose(orphans: list, mode: str) -> dict:
+    """Quarantine or delete orphans; partial uploads and expired quarantine are always deleted"""
+    deleted_bytes = 0
+    quarantined_bytes = 0
+    for kind, relative, size in orphans:
+        path = blobstore.UPLOADS_DIR / relative
+        try:
+            if mode == "delete" or kind in ("staging", "expired"):
+                path.unlink()
+                deleted_bytes += size
+            else:
+                destination = QUARANTINE_DIR / relative
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(path, destination)
+                # Retention counts from quarantine time, not the file's original mtime
+                os.utime(destination)
+                quarantined_bytes += size
+        except FileNotFoundError:
+            # Another worker or a blob release got there first
+            continue
+    return {"deleted_bytes": deleted_bytes, "quarantined_bytes": quarantined_bytes}
+
+# ============= SWEEP =============
+
+async def sweep(mode: str = sweep_mode, dry_run: bool = False, reconcile: bool = reconcile_refcounts) -> dict:
+    """
+    Diff uploads/ against consultation and blob references and dispose of the orphans.
+
+    Covers unreferenced blobs, pre-blob files, renditions of removed images, abandoned
+    staging parts and quarantined files past UPLOAD_QUARANTINE_DAYS.
+    """
+    if mode not in SWEEP_MODES:
+        return {"success": False, "error": f"Unknown sweep mode '{mode}' (use {' or '.join(SWEEP_MODES)})"}
+    started = time.perf_counter()
+    now = datetime.now()
+    settled_before = now - timedelta(minutes=grace_minutes)
+
+    references = await referenced_names()
+    blobs = await reconcile_blobs(references, settled_before, fix=reconcile and not dry_run)
+    live = set(references) | blobs["known"]
+    scan = await asyncio.to_thread(
+        _find_orphans, live, settled_before.timestamp(), (now - timedelta(days=quarantine_days)).timestamp()
+    )
+
+    # store() writes the blob document before the file, so a blob stored since we
+    # read the collection has a document by now - keep those
+    orphans = scan["orphans"]
+    candidates = [relative.name for kind, relative, _ in orphans if kind == "blob"]
+    stored = set()
+    for i in range(0, len(candidates), SWEEP_BATCH_SIZE):
+        batch = candidates[i:i + SWEEP_BATCH_SIZE]
+        stored.update([doc["_id"] async for doc in blobs_collection().find({"_id": {"$in": batch}}, {"_id": 1})])
+    orphans = [o for o in orphans if not (o[0] == "blob" and o[1].name in stored)]
+
+    if dry_run:
+        disposed = {"deleted_bytes": 0, "quarantined_bytes": 0}
+    else:
+        disposed = await asyncio.to_thread(_dispose, orphans, mode)
+    return {
+        "success": True,
+        "mode": mode,
+        "dry_run": dry_run,
+        "scanned": scan["scanned"],
+        "orphans": dict(Counter(kind for kind, _, _ in orphans)),
+        "orphan_bytes": sum(size for _, _, size in orphans),
+        "reclaimed_bytes": disposed["deleted_bytes"],
+        "quarantined_bytes": disposed["quarantined_bytes"],
+        # Referenced by a consultation but no file on disk
+        "missing": len(set(references) - scan["seen"]),
+        "refcounts_mismatched": blobs["mismatched"],
+        "refcounts_fixed": blobs["fixed"],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def summary(report: dict) -> str:
+    """One-line description of a sweep report"""
+    megabytes = lambda size: f"{size / (1024 * 1024):.1f} MB"
+    orphans = ", ".join(f"{count} {kind}" for kind, count in sorted(report["orphans"].items())) or "none"
+    return (
+        f"orphans: {orphans} ({megabytes(report['orphan_bytes'])}); "
+        f"reclaimed {megabytes(report['reclaimed_bytes'])}, quarantined {megabytes(report['quarantined_bytes'])}; "
+        f"{report['missing']} referenced files missing, "
+        f"{report['refcounts_fixed']}/{report['refcounts_mismatched']} refcount mismatches fixed"
+    )
+
+# ============= SCHEDULE =============
+
+async def claim_run(interval: timedelta) -> bool:
+    """Claim the next scheduled sweep; only one worker succeeds per interval"""
+    now = datetime.now()
+    try:
+        await jobs_collection().update_one(
+            {"_id": JOB_ID, "next_run_at": {"$lte": now}},
+            {"$set": {"next_run_at": now + interval, "started_at": now, "pid": os.getpid()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The job document exists and is not due yet
+        return False
+    return True
+
+async def run_periodically():
+    """Sweep every UPLOAD_SWEEP_INTERVAL_HOURS in whichever worker claims the run"""
+    interval = timedelta(hours=interval_hours)
+    while True:
+        await asyncio.sleep(min(interval.total_seconds(), POLL_SECONDS))
+        try:
+            if not await claim_run(interval):
+                continue
+            report = await sweep()
+            await jobs_collection().update_one(
+                {"_id": JOB_ID},
+                {"$set": {"finished_at": datetime.now(), "last_report": report}}
+            )
+            print(f"✅ Upload sweep: {summary(report)}" if report["success"] else f"❌ Upload sweep: {report['error']}")
+        except Exception as e:
+            print(f"❌ Upload sweep failed: {e}")
+
+def start():
+    """Start this worker's sweep loop; None when UPLOAD_SWEEP_INTERVAL_HOURS is 0"""
+    if interval_hours <= 0:
+        return None
+    return asyncio.create_task(run_periodically())
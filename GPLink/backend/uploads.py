@@ -0,0 +1,118 @@
+"""
+GPLink - Upload Pipeline
+Streams image uploads to a temp file off the event loop, hashing and size-checking as they arrive
+"""
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from dotenv import load_dotenv
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import tempfile
+import blobstore
+import crud
+
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Staging lives inside uploads/ so the final rename never crosses filesystems
+STAGING_DIR = blobstore.UPLOADS_DIR / ".tmp"
+STAGING_DIR.mkdir(exist_ok=True)
+
+class UploadTooLarge(ValueError):
+    """Raised while streaming once an upload passes MAX_UPLOAD_BYTES"""
+
+# Image upload routes (POST /api/consultations/{id}/upload-ecg, /upload-xray)
+UPLOAD_PATH_SUFFIXES = ("/upload-ecg", "/upload-xray")
+# Multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """
+    Answer 413 to image uploads whose Content-Length is over the limit.
+
+    Runs before FastAPI parses the multipart form, so an oversized body is never spooled
+    to disk. Chunked uploads (no Content-Length) are still stopped by stage_upload.
+    """
+
+    def __init__(self, app, limit: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.limit = limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"].endswith(UPLOAD_PATH_SUFFIXES):
+            length = Headers(scope=scope).get("content-length", "")
+            if length.isdigit() and int(length) > self.limit + MULTIPART_OVERHEAD:
+                response = JSONResponse(
+                    {"detail": f"File exceeds the {self.limit // (1024 * 1024)} MB upload limit"},
+                    status_code=413,
+                    headers={"Connection": "close"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+def safe_filename(filename: str) -> str:
+    """Drop any client-supplied directory parts so a name cannot escape uploads/"""
+    name = Path((filename or "").replace("\\", "/")).name
+    return name or "upload"
+
+def _stream_to_staging(source, limit: int) -> dict:
+    """Copy source to a staging file in chunks, hashing as we go (runs in a worker thread)"""
+    fd, staged_path = tempfile.mkstemp(dir=STAGING_DIR, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge(f"File exceeds the {limit // (1024 * 1024)} MB upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(staged_path)
+        raise
+    return {"path": Path(staged_path), "size": size, "sha256": digest.hexdigest()}
+
+async def stage_upload(file: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> dict:
+    """Stream an upload to a staging file; returns {path, size, sha256, filename}"""
+    staged = await asyncio.to_thread(_stream_to_staging, file.file, limit)
+    staged["filename"] = safe_filename(file.filename)
+    return staged
+
+def discard_upload(staged: dict):
+    """Remove a staged file that will not be kept"""
+    staged["path"].unlink(missing_ok=True)
+
+async def save_consultation_image(consultation_id: str, image_field: str, file: UploadFile) -> dict:
+    """
+    Stage an upload, then move it into the blob store and attach it to the consultation.
+
+    Nothing lands in the store unless the consultation exists; an image already
+    stored (same SHA-256) is shared rather than written again.
+    """
+    if not await crud.consultation_exists(consultation_id):
+        return {"success": False, "error": "Consultation not found", "code": 404}
+    try:
+        staged = await stage_upload(file)
+    except UploadTooLarge as e:
+        return {"success": False, "error": str(e), "code": 413}
+
+    try:
+        # Atomic rename on the same filesystem: readers never see a partial write
+        filename = await blobstore.store(staged)
+    except OSError as e:
+        discard_upload(staged)
+        return {"success": False, "error": f"Failed to save file: {e}", "code": 500}
+
+    if not await crud.set_consultation_image(consultation_id, image_field, filename):
+        # Deleted while we were streaming
+        await blobstore.release(filename)
+        return {"success": False, "error": "Consultation not found", "code": 404}
+    return {"success": True, "filename": filename, "size": staged["size"], "sha256": staged["sha256"]}
@@ -0,0 +1,73 @@
+"""
+GPLink - Concurrency Benchmark
+Measures API throughput for concurrent list and upload traffic.
+
+Run it against a running backend before and after a change and compare:
+
+    python benchmarks/bench_concurrency.py --consultation-id CON-XXXXXXXX
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+DEFAULT_IMAGE = Path(__file__).parent.parent / "Test_ECG Image_1.png"
+
+def list_consultations(session, base_url):
+    """One list request"""
+    response = session.get(f"{base_url}/api/consultations", params={"limit": 50})
+    response.raise_for_status()
+
+def upload_image(session, base_url, consultation_id, image_bytes):
+    """One ECG upload request"""
+    files = {"file": ("bench_ecg.png", image_bytes, "image/png")}
+    response = session.post(f"{base_url}/api/consultations/{consultation_id}/upload-ecg", files=files)
+    response.raise_for_status()
+
+def run_scenario(name, task, total, concurrency):
+    """Run `total` calls of task across `concurrency` threads and print throughput"""
+    sessions = [requests.Session() for _ in range(concurrency)]
+    latencies = []
+    
+    def timed(i):
+        start = time.perf_counter()
+        task(sessions[i % concurrency])
+        latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<8} {total / elapsed:8.1f} req/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="GPLink concurrent list/upload benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--consultation-id", required=True, help="Existing consultation to upload images to")
+    parser.add_argument("--image", type=Path, default=DEFAULT_IMAGE)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    
+    image_bytes = args.image.read_bytes()
+    list_task = lambda s: list_consultations(s, args.base_url)
+    upload_task = lambda s: upload_image(s, args.base_url, args.consultation_id, image_bytes)
+    # Alternate list and upload calls so uploads compete with reads
+    mixed_task_counter = iter(range(10 ** 9))
+    mixed_task = lambda s: (upload_task if next(mixed_task_counter) % 2 else list_task)(s)
+    
+    print(f"{args.requests} requests, concurrency {args.concurrency}, image {len(image_bytes) / 1024:.0f} KiB")
+    run_scenario("list", list_task, args.requests, args.concurrency)
+    run_scenario("upload", upload_task, args.requests, args.concurrency)
+    run_scenario("mixed", mixed_task, args.requests, args.concurrency)
+
+if __name__ == "__main__":
+    main()
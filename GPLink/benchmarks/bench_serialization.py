@@ -0,0 +1,127 @@
+"""
+GPLink - Serialization Benchmark
+Compares JSON encoding and compression of large consultation pages.
+
+Offline (no server needed) it times the old path - jsonable_encoder plus
+json.dumps over documents whose _id was stringified by hand - against the
+orjson encoder used by the API, and reports gzip/Brotli sizes:
+
+    python benchmarks/bench_serialization.py --documents 200
+
+With --base-url it also times GET /api/consultations on a running backend
+with and without compression:
+
+    python benchmarks/bench_serialization.py --base-url http://localhost:8000
+"""
+
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+import serialization  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def make_consultations(count):
+    """Synthetic consultations shaped like full documents from the collection"""
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "consultation_id": f"CON-{i:026d}",
+            "patient": {"name": f"Patient {i}", "age": 40 + i % 40, "gender": "Male", "ic_number": f"8001011{i:05d}"},
+            "symptoms": "Chest pain radiating to left arm, shortness of breath on exertion. " * 4,
+            "vital_signs": {"bp": "140/90", "hr": 96, "temp": 37.1, "spo2": 97},
+            "clinic_doctor_email": "gp@clinic.my",
+            "clinic_doctor_name": "Dr GP",
+            "assigned_cardiologist_email": "cardio@hospital.my",
+            "status": "pending" if i % 3 else "responded",
+            "urgency": ("routine", "urgent", "emergency")[i % 3],
+            "created_at": now - timedelta(minutes=i),
+            "last_activity_at": now - timedelta(minutes=i),
+            "message_count": i % 5,
+            "version": 1 + i % 4,
+            "updated_at": now
+        }
+        for i in range(count)
+    ]
+
+def timed(fn, rounds):
+    """Median wall time of fn in milliseconds"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def encode_before(documents):
+    """Previous path: stringify _id, then jsonable_encoder and json.dumps"""
+    page = {"items": [dict(d, _id=str(d["_id"])) for d in documents], "next_cursor": None}
+    return json.dumps(jsonable_encoder(page)).encode("utf-8")
+
+def encode_after(documents):
+    """Current path: raw documents straight into orjson"""
+    return serialization.dumps({"items": documents, "next_cursor": None})
+
+def run_offline(count, rounds):
+    documents = make_consultations(count)
+    before = timed(lambda: encode_before(documents), rounds)
+    after = timed(lambda: encode_after(documents), rounds)
+    body = encode_after(documents)
+
+    print(f"{count} consultations, median of {rounds} rounds")
+    print(f"encode   before {before:8.2f} ms   after {after:8.2f} ms   ({before / after:.1f}x)")
+    gzip_ms = timed(lambda: gzip.compress(body, 6), rounds)
+    print(f"size     raw {len(body) / 1024:8.1f} KiB   gzip {len(gzip.compress(body, 6)) / 1024:8.1f} KiB "
+          f"({gzip_ms:.2f} ms)")
+    if brotli is not None:
+        br_ms = timed(lambda: brotli.compress(body, quality=4), rounds)
+        print(f"         brotli {len(brotli.compress(body, quality=4)) / 1024:8.1f} KiB ({br_ms:.2f} ms)")
+
+def run_live(base_url, limit, rounds):
+    import requests
+
+    session = requests.Session()
+    print(f"\nGET {base_url}/api/consultations?limit={limit}, median of {rounds} rounds")
+    for encoding in ("identity", "gzip", "br"):
+        sizes = []
+
+        def fetch():
+            response = session.get(
+                f"{base_url}/api/consultations",
+                params={"limit": limit},
+                headers={"Accept-Encoding": encoding},
+                stream=True
+            )
+            response.raise_for_status()
+            sizes.append(len(response.raw.read()))
+
+        elapsed = timed(fetch, rounds)
+        print(f"{encoding:<9} {elapsed:8.2f} ms   {sizes[-1] / 1024:8.1f} KiB on the wire")
+
+def main():
+    parser = argparse.ArgumentParser(description="GPLink JSON serialization/compression benchmark")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--base-url", help="Also benchmark a running backend")
+    args = parser.parse_args()
+
+    run_offline(args.documents, args.rounds)
+    if args.base_url:
+        run_live(args.base_url, min(args.documents, 200), args.rounds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+GPLink - API Client
+Pooled keep-alive HTTP client for the Streamlit frontend with timeouts, bounded retries and call timing
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Optional, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_API_URL = "http://localhost:8000/api"
+
+# (connect, read) seconds. AI analysis and uploads pass LONG_TIMEOUT explicitly.
+DEFAULT_TIMEOUT = (3.05, float(os.getenv("GPLINK_API_TIMEOUT", "30")))
+LONG_TIMEOUT = (3.05, float(os.getenv("GPLINK_API_LONG_TIMEOUT", "180")))
+MAX_RETRIES = int(os.getenv("GPLINK_API_RETRIES", "2"))
+POOL_SIZE = int(os.getenv("GPLINK_API_POOL_SIZE", "10"))
+
+# Retries cover connection failures for every method, but 5xx/read retries only
+# for idempotent methods - a POST is never sent twice after reaching the server
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+CALL_LOG_SIZE = 200
+# Revalidatable responses kept per browser session; the least recently used is dropped first
+HTTP_CACHE_SIZE = 64
+
+class APIClient:
+    """One requests.Session with a connection pool, shared by every Streamlit session"""
+
+    def __init__(self, base_url: str, pool_size: int = POOL_SIZE, retries: int = MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        # Backend root for non-API paths such as /uploads and /docs
+        self.server_url = re.sub(r"/api$", "", self.base_url)
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, path: str, timeout=DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+        """Send a request to base_url + path and record how long it took"""
+        status = None
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=timeout, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            record_call(method, path, status, (time.perf_counter() - start) * 1000)
+
+    def get(self, path: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+        return self.request("GET", path, params=params, **kwargs)
+
+    def post(self, path: str, json: Any = None, **kwargs) -> requests.Response:
+        return self.request("POST", path, json=json, **kwargs)
+
+    def put(self, path: str, json: Any = None, **kwargs) -> requests.Response:
+        return self.request("PUT", path, json=json, **kwargs)
+
+    def patch(self, path: str, json: Any = None, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, json=json, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def image_url(self, name: str, width: Optional[int] = None) -> str:
+        """URL of an uploaded image; with a width, its WebP thumbnail instead of the original"""
+        if width:
+            return f"{self.base_url}/images/{name}/thumb?w={width}"
+        return f"{self.base_url}/images/{name}"
+
+    def get_cached(self, path: str, params: Optional[dict] = None) -> Tuple[requests.Response, Any]:
+        """GET with If-None-Match revalidation; a 304 reuses the body cached in this session (LRU, HTTP_CACHE_SIZE)"""
+        cache = st.session_state.setdefault("_http_cache", OrderedDict())
+        key = (path, tuple(sorted((params or {}).items())))
+        headers = {}
+        if key in cache:
+            cache.move_to_end(key)
+            headers["If-None-Match"] = cache[key][0]
+        response = self.get(path, params=params, headers=headers)
+        if response.status_code == 304:
+            return response, cache[key][1]
+        if response.status_code != 200:
+            return response, None
+        data = response.json()
+        if response.headers.get("ETag"):
+            cache[key] = (response.headers["ETag"], data)
+            cache.move_to_end(key)
+            while len(cache) > HTTP_CACHE_SIZE:
+                cache.popitem(last=False)
+        return response, data
+
+@st.cache_resource
+def get_client(base_url: str) -> APIClient:
+    """The process-wide client for a backend URL"""
+    return APIClient(base_url)
+
+def api_url() -> str:
+    """Backend API URL from GPLINK_API_URL (env or Streamlit secrets), default localhost"""
+    return os.getenv("GPLINK_API_URL", DEFAULT_API_URL)
+
+# ============= CALL TIMING =============
+
+def record_call(method: str, path: str, status: Optional[int], elapsed_ms: float):
+    """Append a call to this browser session's log (the client itself is shared)"""
+    calls = st.session_state.setdefault("_api_calls", deque(maxlen=CALL_LOG_SIZE))
+    calls.append({"method": method, "path": path, "status": status, "ms": round(elapsed_ms, 1)})
+
+def recent_calls() -> list:
+    """This session's calls, newest first"""
+    return list(reversed(st.session_state.get("_api_calls", [])))
+
+def endpoint_route(path: str) -> str:
+    """Collapse IDs and emails so calls to the same endpoint group together"""
+    return "/".join(
+        "{id}" if "@" in segment or segment.startswith("CON-") else segment
+        for segment in path.split("?")[0].split("/")
+    )
+
+def slowest_endpoints() -> list:
+    """Per-endpoint call count, average and max latency, slowest first"""
+    routes = {}
+    for call in st.session_state.get("_api_calls", []):
+        routes.setdefault((call["method"], endpoint_route(call["path"])), []).append(call["ms"])
+    summary = [
+        {"endpoint": f"{method} {route}", "calls": len(times),
+         "avg_ms": round(sum(times) / len(times), 1), "max_ms": max(times)}
+        for (method, route), times in routes.items()
+    ]
+    return sorted(summary, key=lambda row: row["avg_ms"], reverse=True)
@@ -5,6 +5,7 @@ User interface for clinic doctors and cardiologists
 
 import streamlit as st
 import requests
+import re
 import json
 import os
 import base64
@@ -19,6 +20,7 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib import colors
 import google.generativeai as genai
 from dotenv import load_dotenv
+from api_client import get_client, api_url, recent_calls, slowest_endpoints, LONG_TIMEOUT
 
 # Load environment variables from parent directory
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -26,8 +28,8 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 # Memory optimization: Force garbage collection
 gc.collect()
 
-# API Base URL
-API_URL = "http://localhost:8000/api"
+# Pooled API client (base URL from GPLINK_API_URL)
+api = get_client(api_url())
 
 st.set_page_config(
     page_title="GPLink Cardio™ | GP-Cardiologist Consultation Portal",
@@ -159,13 +161,13 @@ def register_doctor(name, email, role, hospital_clinic, ic_passport, mmc_number,
     }
     if nsr_number:
         payload["nsr_number"] = nsr_number
-    response = requests.post(f"{API_URL}/doctors/register", json=payload)
+    response = api.post(f"/doctors/register", json=payload)
     return response.json()
 
 def get_all_doctors():
     """Get all registered doctors"""
-    response = requests.get(f"{API_URL}/doctors")
-    return response.json()
+    response, doctors = api.get_cached(f"/doctors")
+    return doctors if doctors is not None else response.json()
 
 def update_doctor(old_email, name, email, role, hospital_clinic, ic_passport, mmc_number, nsr_number=None):
     """Update doctor information"""
@@ -179,14 +181,14 @@ def update_doctor(old_email, name, email, role, hospital_clinic, ic_passport, mm
     }
     if nsr_number:
         payload["nsr_number"] = nsr_number
-    response = requests.put(f"{API_URL}/doctors/{old_email}", json=payload)
+    response = api.put(f"/doctors/{old_email}", json=payload)
     result = response.json()
     print(f"DEBUG - Update doctor response: {result}")  # Debug logging
     return result
 
 def delete_doctor(email):
     """Delete doctor"""
-    response = requests.delete(f"{API_URL}/doctors/{email}")
+    response = api.delete(f"/doctors/{email}")
     return response.json()
 
 def create_consultation(patient_data, symptoms, vital_signs, clinic_doctor_email, urgency, 
@@ -205,20 +207,149 @@ def create_consultation(patient_data, symptoms, vital_signs, clinic_doctor_email
         "image_remarks": image_remarks,
         "provisional_diagnosis": provisional_diagnosis
     }
-    response = requests.post(
-        f"{API_URL}/consultations?clinic_doctor_email={clinic_doctor_email}",
+    response = api.post(
+        f"/consultations?clinic_doctor_email={clinic_doctor_email}",
         json=payload
     )
     return response.json()
 
-def get_consultations(status=None):
-    """Get all consultations"""
-    url = f"{API_URL}/consultations"
+def get_consultations_page(status=None, limit=50, cursor=None, clinic_doctor_email=None, cardiologist_email=None,
+                           view=None):
+    """Get one page of consultations (newest first) and the cursor for the next page"""
+    params = {"limit": limit}
+    if view:
+        params["view"] = view
     if status:
-        url += f"?status={status}"
-    response = requests.get(url)
+        params["status"] = status
+    if cursor:
+        params["cursor"] = cursor
+    if clinic_doctor_email:
+        params["clinic_doctor_email"] = clinic_doctor_email
+    if cardiologist_email:
+        params["cardiologist_email"] = cardiologist_email
+    response, page = api.get_cached(f"/consultations", params)
+    return page if page is not None else response.json()
+
+def get_consultations(list_key, first_page, status=None, clinic_doctor_email=None, cardiologist_email=None,
+                      view=None):
+    """Consultations shown so far: the bundle's first page plus pages added with "Load more"
+
+    Returns (consultations, next_cursor). Later pages are kept in session state under list_key,
+    so a rerun never refetches them; changing the filters starts again from the first page.
+    """
+    filters = (status, clinic_doctor_email, cardiologist_email, view)
+    loaded = st.session_state.get(list_key)
+    if not loaded or loaded["filters"] != filters:
+        loaded = {"filters": filters, "items": [], "next_cursor": first_page.get("next_cursor"), "pages": 0}
+        st.session_state[list_key] = loaded
+    
+    # A case created since the first page was loaded can shift later pages; skip repeats
+    seen = set()
+    consultations = []
+    for consult in first_page["items"] + loaded["items"]:
+        if consult["consultation_id"] not in seen:
+            seen.add(consult["consultation_id"])
+            consultations.append(consult)
+    next_cursor = loaded["next_cursor"] if loaded["pages"] else first_page.get("next_cursor")
+    return consultations, next_cursor
+
+def load_more_consultations(list_key, next_cursor):
+    """Render a "Load more" button that appends the next page to the list in session state"""
+    if not next_cursor:
+        return
+    if st.button("⬇️ Load more", key=f"{list_key}_load_more"):
+        loaded = st.session_state[list_key]
+        status, clinic_doctor_email, cardiologist_email, view = loaded["filters"]
+        page = get_consultations_page(status, limit=200, cursor=next_cursor,
+                                      clinic_doctor_email=clinic_doctor_email,
+                                      cardiologist_email=cardiologist_email, view=view)
+        loaded["items"].extend(page["items"])
+        loaded["next_cursor"] = page.get("next_cursor")
+        loaded["pages"] += 1
+        st.rerun()
+
+# Sidebar page (badges stripped) -> bootstrap bundle with the data that page renders
+PAGE_BUNDLES = {
+    "🏠 Home": "home",
+    "➕ New Consultation": "new-consultation",
+    "📋 View My Consultations": "consultations",
+    "📋 View Consultations": "consultations",
+    "📋 View My Responses": "consultations",
+    "💬 Respond to Consultation": "respond",
+    "📊 Statistics": "statistics",
+    "📊 My Statistics": "statistics",
+    "👥 Manage Doctors": "doctors",
+}
+
+# Status filter labels on the consultations page -> API values
+STATUS_FILTERS = {"All": None, "Pending": "pending", "Reviewed": "reviewed", "Completed": "completed"}
+
+def strip_badge(page_label):
+    """Remove notification badges such as (1), (🔴1) or (🔴1 + 2) from a menu label"""
+    return re.sub(r'\s*\([^)]*\).*$', '', page_label).strip()
+
+def get_bootstrap(page_label, email, status=None):
+    """Fetch the user, sidebar counters and the page's data in one request"""
+    params = {"user": email}
+    if status:
+        params["status"] = status
+    bundle_page = PAGE_BUNDLES.get(strip_badge(page_label), "sidebar")
+    response, bundle = api.get_cached(f"/bootstrap/{bundle_page}", params)
+    if bundle is None:
+        response.raise_for_status()
+    return bundle
+
+def claim_consultation(consultation_id, cardiologist_email):
+    """Claim an unassigned consultation; returns the raw response so callers can check for 409"""
+    return api.post(
+        f"/consultations/{consultation_id}/claim",
+        params={"cardiologist_email": cardiologist_email}
+    )
+
+def get_consultation(consultation_id):
+    """Get one consultation with every field"""
+    _, consultation = api.get_cached(f"/consultations/{consultation_id}")
+    return consultation
+
+def patch_consultation(consultation_id, changes):
+    """Partially update a consultation; returns the raw response"""
+    return api.patch(
+        f"/consultations/{consultation_id}",
+        params={"fields": "consultation_id"},
+        json=changes
+    )
+
+def bulk_delete_consultations(consultation_ids):
+    """Delete many consultations in one request"""
+    response = api.post(
+        f"/consultations/bulk-delete",
+        json={"consultation_ids": list(consultation_ids)}
+    )
     return response.json()
 
+def get_consultation_messages(consultation_id):
+    """Get a consultation's full follow-up discussion, oldest first (pages revalidated by ETag)"""
+    messages = []
+    cursor = None
+    while True:
+        params = {"limit": 200}
+        if cursor:
+            params["cursor"] = cursor
+        response, page = api.get_cached(f"/consultations/{consultation_id}/messages", params)
+        if page is None:
+            return messages
+        messages.extend(page["items"])
+        cursor = page.get("next_cursor")
+        if not cursor:
+            return messages
+
+def add_consultation_message(consultation_id, note, from_name, email):
+    """Append a follow-up message; returns the raw response"""
+    return api.post(
+        f"/consultations/{consultation_id}/messages",
+        json={"note": note, "from": from_name, "email": email}
+    )
+
 def respond_to_consultation(consultation_id, diagnosis, recommendations, notes, cardiologist_email):
     """Cardiologist responds to consultation"""
     payload = {
@@ -227,27 +358,22 @@ def respond_to_consultation(consultation_id, diagnosis, recommendations, notes,
         "recommendations": recommendations,
         "cardiologist_notes": notes
     }
-    response = requests.put(
-        f"{API_URL}/consultations/{consultation_id}/respond?cardiologist_email={cardiologist_email}",
+    response = api.put(
+        f"/consultations/{consultation_id}/respond?cardiologist_email={cardiologist_email}",
         json=payload
     )
     return response.json()
 
-def get_stats():
-    """Get system statistics"""
-    response = requests.get(f"{API_URL}/stats")
-    return response.json()
-
 def upload_ecg(consultation_id, file):
     """Upload ECG image"""
     files = {"file": (file.name, file.getvalue(), file.type)}
-    response = requests.post(f"{API_URL}/consultations/{consultation_id}/upload-ecg", files=files)
+    response = api.post(f"/consultations/{consultation_id}/upload-ecg", files=files, timeout=LONG_TIMEOUT)
     return response.json()
 
 def upload_xray(consultation_id, file):
     """Upload X-Ray image"""
     files = {"file": (file.name, file.getvalue(), file.type)}
-    response = requests.post(f"{API_URL}/consultations/{consultation_id}/upload-xray", files=files)
+    response = api.post(f"/consultations/{consultation_id}/upload-xray", files=files, timeout=LONG_TIMEOUT)
     return response.json()
 
 def generate_referral_letter_pdf(consultation, gp_doctor, referral_reason="", include_images=False):
@@ -443,8 +569,8 @@ if not st.session_state.logged_in:
         if st.button("🔓 Login", type="primary", use_container_width=True):
             if login_email and login_password:
                 try:
-                    response = requests.post(
-                        f"{API_URL}/doctors/login",
+                    response = api.post(
+                        f"/doctors/login",
                         json={"email": login_email, "password": login_password}
                     )
                     if response.status_code == 200:
@@ -535,7 +661,7 @@ if not st.session_state.logged_in:
                                 "nsr_number": nsr_number if role == "Cardiologist" else None
                             }
                             
-                            response = requests.post(f"{API_URL}/doctors/register", json=doctor_data)
+                            response = api.post(f"/doctors/register", json=doctor_data)
                             if response.status_code == 200:
                                 st.success("✅ Registration successful! Please login with your credentials.")
                                 del st.session_state.show_registration
@@ -545,8 +671,8 @@ if not st.session_state.logged_in:
                                 st.warning(f"⚠️ Email {email} already exists!")
                                 st.info("💡 Setting password...")
                                 
-                                password_response = requests.put(
-                                    f"{API_URL}/doctors/{email}/password",
+                                password_response = api.put(
+                                    f"/doctors/{email}/password",
                                     json={"password": password}
                                 )
                                 
@@ -561,7 +687,7 @@ if not st.session_state.logged_in:
                                 st.error(f"❌ {error_detail}")
                         except requests.exceptions.RequestException as req_err:
                             st.error(f"❌ Connection Error: {req_err}")
-                            st.info("💡 Make sure backend is running on http://localhost:8000")
+                            st.info(f"💡 Make sure backend is running on {api.server_url}")
                         except Exception as e:
                             st.error(f"❌ Error: {type(e).__name__}: {str(e)}")
                     else:
@@ -620,22 +746,28 @@ st.sidebar.markdown("### 📋 Navigation Menu")
 user_role = st.session_state.user['role']
 user_email = st.session_state.user['email']
 
-# Get notification counts
+# One bootstrap request per rerun. The radio's session key already holds the
+# page being opened, so the bundle can be fetched before the menu is drawn.
 try:
-    all_consultations = get_consultations(None)  # Get all consultations
+    page_bundle = get_bootstrap(
+        st.session_state.get("nav_page", "🏠 Home"), user_email,
+        STATUS_FILTERS[st.session_state.get("status_filter", "All")]
+    )
+except:
+    page_bundle = {}
+
+# Notification counts from the pre-aggregated counters
+try:
+    counters = page_bundle["counters"]
     
     if user_role == 'clinic_doctor':
         # Count reviewed/completed consultations for this GP
-        my_consultations = [c for c in all_consultations if c['clinic_doctor_email'] == user_email]
-        new_responses = len([c for c in my_consultations if c['status'] in ['reviewed', 'completed']])
+        new_responses = counters['clinic']['reviewed'] + counters['clinic']['completed']
         responses_badge = f" ({new_responses})" if new_responses > 0 else ""
     elif user_role == 'cardiologist':
         # Count pending consultations: assigned to me (priority) + unassigned (available)
-        assigned_to_me = [c for c in all_consultations if c['status'] == 'pending' and c.get('assigned_cardiologist_email') == user_email]
-        unassigned = [c for c in all_consultations if c['status'] == 'pending' and not c.get('assigned_cardiologist_email')]
-        
-        assigned_count = len(assigned_to_me)
-        unassigned_count = len(unassigned)
+        assigned_count = counters['assigned']['pending']
+        unassigned_count = counters['unassigned']['pending']
         
         if assigned_count > 0 and unassigned_count > 0:
             pending_badge = f" (🔴{assigned_count} + {unassigned_count})"  # Red badge for assigned + unassigned count
@@ -684,13 +816,19 @@ else:
 page = st.sidebar.radio(
     "",
     navigation_options,
-    label_visibility="collapsed"
+    label_visibility="collapsed",
+    key="nav_page"
 )
 
 # Normalize page name (remove notification badges)
-import re
-# Remove various badge formats: (1), (🔴1), (🔴1 + 2), etc.
-page_clean = re.sub(r'\s*\([^)]*\).*$', '', page).strip()
+page_clean = strip_badge(page)
+
+# The menu resets to Home if its badges changed, so the bundle may be for another page
+if page_bundle.get("page") != PAGE_BUNDLES.get(page_clean, "sidebar"):
+    try:
+        page_bundle = get_bootstrap(page, user_email, STATUS_FILTERS[st.session_state.get("status_filter", "All")])
+    except:
+        page_bundle = {}
 
 # Custom CSS for navigation styling
 st.sidebar.markdown("""
@@ -736,6 +874,15 @@ button[kind="secondary"] p {
 </style>
 """, unsafe_allow_html=True)
 
+# API timing debug panel (GPLINK_DEBUG=1 or ?debug=1)
+if os.getenv("GPLINK_DEBUG") == "1" or st.query_params.get("debug") == "1":
+    with st.sidebar.expander("🐞 API Calls"):
+        st.caption(f"Backend: {api.base_url}")
+        st.markdown("**Slowest endpoints**")
+        st.dataframe(slowest_endpoints(), use_container_width=True, hide_index=True)
+        st.markdown("**Recent calls**")
+        st.dataframe(recent_calls()[:20], use_container_width=True, hide_index=True)
+
 if logout_clicked:
     st.session_state.logged_in = False
     st.session_state.user = None
@@ -767,7 +914,7 @@ if page_clean == "🏠 Home":
     """)
     
     try:
-        stats = get_stats()
+        stats = page_bundle["stats"]
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Total Consultations", stats["total_consultations"])
         col2.metric("Pending", stats["pending"], delta="🔴")
@@ -778,12 +925,12 @@ if page_clean == "🏠 Home":
     
     # API Documentation Link
     st.markdown("---")
-    st.markdown("""
+    st.markdown(f"""
     <div style="text-align: center; padding: 1rem 0;">
         <p style="font-size: 0.9rem;">
             📚 <b>API Documentation (Swagger):</b> 
-            <a href="http://127.0.0.1:8000/docs" target="_blank" style="color: #9A7D61; text-decoration: none; font-weight: 600;">
-                http://127.0.0.1:8000/docs
+            <a href="{api.server_url}/docs" target="_blank" style="color: #9A7D61; text-decoration: none; font-weight: 600;">
+                {api.server_url}/docs
             </a>
         </p>
     </div>
@@ -860,7 +1007,7 @@ elif page_clean == "👨‍⚕️ Register New Doctor":
                 }
                 
                 try:
-                    response = requests.post(f"{API_URL}/doctors/register", json=doctor_data)
+                    response = api.post(f"/doctors/register", json=doctor_data)
                     
                     if response.status_code == 200:
                         st.success(f"✅ Doctor registered successfully!")
@@ -870,8 +1017,8 @@ elif page_clean == "👨‍⚕️ Register New Doctor":
                         st.warning(f"⚠️ Email {email} already exists in database!")
                         st.info("💡 Setting password for existing user...")
                         
-                        password_response = requests.put(
-                            f"{API_URL}/doctors/{email}/password",
+                        password_response = api.put(
+                            f"/doctors/{email}/password",
                             json={"password": password}
                         )
                         
@@ -894,7 +1041,7 @@ elif page_clean == "👥 Manage Doctors":
     
     try:
         # Get all doctors
-        doctors = get_all_doctors()
+        doctors = page_bundle["doctors"]
         
         if doctors:
             # Separate doctors by role
@@ -999,8 +1146,8 @@ elif page_clean == "👥 Manage Doctors":
                                         st.error("❌ Password must be at least 6 characters!")
                                     else:
                                         try:
-                                            response = requests.put(
-                                                f"{API_URL}/doctors/{doctor['email']}/password",
+                                            response = api.put(
+                                                f"/doctors/{doctor['email']}/password",
                                                 json={"password": new_pwd}
                                             )
                                             if response.status_code == 200:
@@ -1147,8 +1294,8 @@ elif page_clean == "👥 Manage Doctors":
                                         st.error("❌ Password must be at least 6 characters!")
                                     else:
                                         try:
-                                            response = requests.put(
-                                                f"{API_URL}/doctors/{doctor['email']}/password",
+                                            response = api.put(
+                                                f"/doctors/{doctor['email']}/password",
                                                 json={"password": new_pwd}
                                             )
                                             if response.status_code == 200:
@@ -1323,8 +1470,7 @@ elif page_clean == "➕ New Consultation":
         
         # Get list of cardiologists
         try:
-            all_doctors = get_all_doctors()
-            cardiologists = [d for d in all_doctors if d['role'] == 'cardiologist']
+            cardiologists = page_bundle["cardiologists"]
             cardio_options = ["Any Available Cardiologist"] + [f"{c['name']} ({c['hospital_clinic']})" for c in cardiologists]
             cardio_emails = [None] + [c['email'] for c in cardiologists]
             
@@ -1626,27 +1772,24 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
         st.header("My Responses")
         st.markdown(f"**Cardiologist:** {st.session_state.user['name']}")
     
-    status_filter = st.selectbox("Filter by Status", ["All", "Pending", "Reviewed", "Completed"])
+    status_filter = st.selectbox("Filter by Status", list(STATUS_FILTERS), key="status_filter")
     # Map display values back to API values
-    status_map = {"All": None, "Pending": "pending", "Reviewed": "reviewed", "Completed": "completed"}
-    status_value = status_map[status_filter]
+    status_value = STATUS_FILTERS[status_filter]
     
     try:
-        # Get all consultations
-        all_consultations = get_consultations(status_value)
-        
-        # Filter by user (admin sees all)
+        # Filter by user on the server (admin sees all); the bundle holds the first page
+        first_page = page_bundle["consultations"]
         if user_role == 'admin':
             # Admin sees all consultations
-            consultations = all_consultations
+            consultations, next_cursor = get_consultations("consultation_list", first_page, status_value)
         elif user_role == 'clinic_doctor':
             # GP sees only consultations they created
-            consultations = [c for c in all_consultations if c['clinic_doctor_email'] == user_email]
+            consultations, next_cursor = get_consultations("consultation_list", first_page, status_value,
+                                                           clinic_doctor_email=user_email)
         else:  # cardiologist
             # Cardiologist sees consultations they responded to OR assigned to them
-            consultations = [c for c in all_consultations if 
-                           c.get('cardiologist_email') == user_email or 
-                           c.get('assigned_cardiologist_email') == user_email]
+            consultations, next_cursor = get_consultations("consultation_list", first_page, status_value,
+                                                           cardiologist_email=user_email)
         
         if consultations:
             # Initialize session state for selected consultations
@@ -1657,7 +1800,8 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
             st.markdown("---")
             col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
-                st.markdown(f"**Total: {len(consultations)} consultations**")
+                more = " (more below)" if next_cursor else ""
+                st.markdown(f"**Showing {len(consultations)} consultations{more}**")
             with col2:
                 select_all = st.checkbox("Select All", key="select_all_consultations")
                 if select_all:
@@ -1676,15 +1820,14 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                 with col1:
                     if st.button("✅ Yes, Delete All", type="primary", key="confirm_bulk_yes"):
                         deleted_count = 0
-                        for consultation_id in st.session_state.selected_consultations:
-                            try:
-                                response = requests.delete(f"{API_URL}/consultations/{consultation_id}")
-                                if response.status_code == 200:
-                                    deleted_count += 1
-                            except:
-                                pass
+                        try:
+                            deleted_count = bulk_delete_consultations(st.session_state.selected_consultations)["deleted"]
+                        except:
+                            pass
                         st.success(f"✅ Deleted {deleted_count} consultation(s)!")
                         st.session_state.selected_consultations = []
+                        # Pages loaded with "Load more" may hold deleted cases
+                        st.session_state.pop("consultation_list", None)
                         st.session_state.confirm_bulk_delete = False
                         st.rerun()
                 with col2:
@@ -1723,16 +1866,17 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                         # Display medical images if available
                         if consult['patient'].get('ecg_image'):
                             st.markdown("**📊 ECG Image:**")
-                            st.image(f"http://localhost:8000/uploads/{consult['patient']['ecg_image']}", 
-                                   caption="ECG", width=400)
+                            st.image(api.image_url(consult['patient']['ecg_image'], width=400), caption="ECG", width=400)
+                            st.markdown(f"[🔍 Open full size]({api.image_url(consult['patient']['ecg_image'])})")
                             
                             # AI Analysis button
                             if st.button("🤖 Analyse with NEXUS AI", key=f"analyze_ecg_{consult['consultation_id']}"):
                                     with st.spinner("🔄 Analyzing ECG..."):
                                         try:
-                                            response = requests.post(
-                                                f"{API_URL}/consultations/{consult['consultation_id']}/analyze-image",
-                                                params={"image_type": "ecg"}
+                                            response = api.post(
+                                                f"/consultations/{consult['consultation_id']}/analyze-image",
+                                                params={"image_type": "ecg"},
+                                                timeout=LONG_TIMEOUT
                                             )
                                             if response.status_code == 200:
                                                 result = response.json()
@@ -1750,16 +1894,17 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                         
                         if consult['patient'].get('xray_image'):
                             st.markdown("**🩻 X-Ray Image:**")
-                            st.image(f"http://localhost:8000/uploads/{consult['patient']['xray_image']}", 
-                                   caption="X-Ray", width=400)
+                            st.image(api.image_url(consult['patient']['xray_image'], width=400), caption="X-Ray", width=400)
+                            st.markdown(f"[🔍 Open full size]({api.image_url(consult['patient']['xray_image'])})")
                             
                             # AI Analysis button
                             if st.button("🤖 Analyse with NEXUS AI", key=f"analyze_xray_{consult['consultation_id']}"):
                                     with st.spinner("🔄 Analyzing X-Ray..."):
                                         try:
-                                            response = requests.post(
-                                                f"{API_URL}/consultations/{consult['consultation_id']}/analyze-image",
-                                                params={"image_type": "xray"}
+                                            response = api.post(
+                                                f"/consultations/{consult['consultation_id']}/analyze-image",
+                                                params={"image_type": "xray"},
+                                                timeout=LONG_TIMEOUT
                                             )
                                             if response.status_code == 200:
                                                 result = response.json()
@@ -1844,22 +1989,24 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                         st.info(consult['image_remarks'])
                     
                     # Display Follow-up Notes if available
-                    if consult.get('followup_notes') and len(consult['followup_notes']) > 0:
+                    if consult.get('message_count', 0) > 0:
                         st.markdown("---")
                         st.markdown("**📝 Follow-up Discussion:**")
-                        for idx, note in enumerate(consult['followup_notes'], 1):
-                            timestamp = note.get('timestamp', 'N/A')
-                            if timestamp != 'N/A':
-                                try:
-                                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                                    timestamp = dt.strftime('%d %b %Y, %I:%M %p')
-                                except:
-                                    pass
+                        # Loaded on demand: a list of cases would otherwise fetch every thread on each rerun
+                        if st.toggle(f"Show {consult['message_count']} message(s)", key=f"show_messages_{consult['consultation_id']}"):
+                            for idx, note in enumerate(get_consultation_messages(consult['consultation_id']), 1):
+                                timestamp = note.get('created_at', 'N/A')
+                                if timestamp != 'N/A':
+                                    try:
+                                        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+                                        timestamp = dt.strftime('%d %b %Y, %I:%M %p')
+                                    except:
+                                        pass
                             
-                            with st.expander(f"💬 Note #{idx} - {note.get('from', 'Unknown')} ({timestamp})"):
-                                st.write(f"**From:** {note.get('from', 'Unknown')} ({note.get('email', 'N/A')})")
-                                st.write(f"**Time:** {timestamp}")
-                                st.info(note.get('note', 'No content'))
+                                with st.expander(f"💬 Note #{idx} - {note.get('from', 'Unknown')} ({timestamp})"):
+                                    st.write(f"**From:** {note.get('from', 'Unknown')} ({note.get('email', 'N/A')})")
+                                    st.write(f"**Time:** {timestamp}")
+                                    st.info(note.get('note', 'No content'))
                     
                     if consult['status'] in ['reviewed', 'completed']:
                         st.markdown("---")
@@ -1892,7 +2039,7 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                     with col_a:
                                         if st.button("✅ Yes", key=f"yes_complete_{consult['consultation_id']}"):
                                             try:
-                                                response = requests.put(f"{API_URL}/consultations/{consult['consultation_id']}/complete")
+                                                response = api.put(f"/consultations/{consult['consultation_id']}/complete")
                                                 if response.status_code == 200:
                                                     st.success("✅ Consultation marked as completed!")
                                                     st.session_state[complete_key] = False
@@ -1924,33 +2071,12 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                     if st.form_submit_button("📤 Send to Cardiologist"):
                                         if followup_note:
                                             try:
-                                                # Get existing follow-up notes or create new list
-                                                existing_notes = consult.get('followup_notes', [])
-                                                
-                                                # Add new note with timestamp and GP name
-                                                new_note = {
-                                                    "note": followup_note,
-                                                    "from": st.session_state.user['name'],
-                                                    "email": st.session_state.user['email'],
-                                                    "timestamp": datetime.now().isoformat()
-                                                }
-                                                existing_notes.append(new_note)
-                                                
-                                                # Update consultation - include ALL required fields
-                                                update_payload = {
-                                                    "patient": consult['patient'],
-                                                    "symptoms": consult['symptoms'],
-                                                    "vital_signs": consult['vital_signs'],
-                                                    "clinic_doctor_email": consult['clinic_doctor_email'],
-                                                    "urgency": consult['urgency'],
-                                                    "assigned_cardiologist_email": consult.get('assigned_cardiologist_email'),
-                                                    "lab_investigations": consult.get('lab_investigations', []),
-                                                    "followup_notes": existing_notes
-                                                }
-                                                
-                                                response = requests.put(
-                                                    f"{API_URL}/consultations/{consult['consultation_id']}",
-                                                    json=update_payload
+                                                # Append atomically on the server (timestamped there)
+                                                response = add_consultation_message(
+                                                    consult['consultation_id'],
+                                                    followup_note,
+                                                    st.session_state.user['name'],
+                                                    st.session_state.user['email']
                                                 )
                                                 
                                                 if response.status_code == 200:
@@ -2000,7 +2126,7 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                             with col1:
                                 if st.button("✅ Yes", key=f"confirm_yes_{consult['consultation_id']}"):
                                     try:
-                                        response = requests.delete(f"{API_URL}/consultations/{consult['consultation_id']}")
+                                        response = api.delete(f"/consultations/{consult['consultation_id']}")
                                         if response.status_code == 200:
                                             st.success("✅ Deleted!")
                                             st.session_state[confirm_key] = False
@@ -2054,7 +2180,7 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                 # Show current images status
                                 col1, col2 = st.columns(2)
                                 with col1:
-                                    has_ecg = consult.get('ecg_image_url') is not None
+                                    has_ecg = consult['patient'].get('ecg_image') is not None
                                     if has_ecg:
                                         st.info(f"✅ ECG image exists")
                                         remove_ecg = st.checkbox("Remove existing ECG", key=f"remove_ecg_{consult['consultation_id']}")
@@ -2070,7 +2196,7 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                     )
                                 
                                 with col2:
-                                    has_xray = consult.get('xray_image_url') is not None
+                                    has_xray = consult['patient'].get('xray_image') is not None
                                     if has_xray:
                                         st.info(f"✅ X-Ray image exists")
                                         remove_xray = st.checkbox("Remove existing X-Ray", key=f"remove_xray_{consult['consultation_id']}")
@@ -2103,21 +2229,18 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                                 "spo2": edit_spo2,
                                                 "respiratory_rate": edit_rr
                                             },
-                                            "urgency": edit_urgency,
-                                            "clinic_doctor_email": consult['clinic_doctor_email']
+                                            "urgency": edit_urgency
                                         }
                                         
                                         # Handle image removals by setting to None
                                         if remove_ecg and has_ecg:
-                                            update_data["ecg_image_url"] = None
+                                            update_data["patient"]["ecg_image"] = None
                                         if remove_xray and has_xray:
-                                            update_data["xray_image_url"] = None
+                                            update_data["patient"]["xray_image"] = None
                                         
-                                        # Update consultation data (including image removals)
-                                        response = requests.put(
-                                            f"{API_URL}/consultations/{consultation_id}",
-                                            json=update_data
-                                        )
+                                        # PATCH only the edited fields (including image removals);
+                                        # untouched patient fields such as images are kept
+                                        response = patch_consultation(consultation_id, update_data)
                                         
                                         if response.status_code == 200:
                                             success_messages = ["✅ Consultation data updated"]
@@ -2126,9 +2249,10 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                             if new_ecg_file is not None:
                                                 try:
                                                     files = {"file": (new_ecg_file.name, new_ecg_file, new_ecg_file.type)}
-                                                    ecg_response = requests.post(
-                                                        f"{API_URL}/consultations/{consultation_id}/upload-ecg",
-                                                        files=files
+                                                    ecg_response = api.post(
+                                                        f"/consultations/{consultation_id}/upload-ecg",
+                                                        files=files,
+                                                        timeout=LONG_TIMEOUT
                                                     )
                                                     if ecg_response.status_code == 200:
                                                         success_messages.append("✅ ECG image uploaded")
@@ -2141,9 +2265,10 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                             if new_xray_file is not None:
                                                 try:
                                                     files = {"file": (new_xray_file.name, new_xray_file, new_xray_file.type)}
-                                                    xray_response = requests.post(
-                                                        f"{API_URL}/consultations/{consultation_id}/upload-xray",
-                                                        files=files
+                                                    xray_response = api.post(
+                                                        f"/consultations/{consultation_id}/upload-xray",
+                                                        files=files,
+                                                        timeout=LONG_TIMEOUT
                                                     )
                                                     if xray_response.status_code == 200:
                                                         success_messages.append("✅ X-Ray image uploaded")
@@ -2182,12 +2307,14 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                     
                     if st.button("📄 Generate Referral Letter", key=f"ref_{consult['consultation_id']}", type="primary"):
                         try:
-                            # Get GP doctor details
+                            # Get GP doctor details (the logged-in GP's own profile needs no request)
                             gp_email = consult['clinic_doctor_email']
-                            gp_doctor_response = requests.get(f"{API_URL}/doctors/{gp_email}")
+                            if gp_email == st.session_state.user['email']:
+                                gp_doctor = st.session_state.user
+                            else:
+                                _, gp_doctor = api.get_cached(f"/doctors/{gp_email}")
                             
-                            if gp_doctor_response.status_code == 200:
-                                gp_doctor = gp_doctor_response.json()
+                            if gp_doctor:
                                 pdf_buffer = generate_referral_letter_pdf(consult, gp_doctor, referral_reason, include_images)
                                 
                                 st.download_button(
@@ -2202,6 +2329,8 @@ elif page_clean == "📋 View My Consultations" or page_clean == "📋 View Cons
                                 st.error("❌ Could not fetch GP doctor details")
                         except Exception as e:
                             st.error(f"❌ Error generating letter: {e}")
+            
+            load_more_consultations("consultation_list", next_cursor)
         else:
             st.info("No consultations found")
     except Exception as e:
@@ -2225,22 +2354,27 @@ elif page_clean == "💬 Respond to Consultation":
         st.stop()
     
     try:
-        pending_consultations = get_consultations("pending")
+        # Server splits and orders the queue (urgency, then oldest first) and sends
+        # summary rows for the first cases of each bucket plus the full counts
+        queue = page_bundle["queue"]
+        assigned_to_me = queue['assigned_to_me']
+        unassigned = queue['unassigned']
+        assigned_to_others = queue['assigned_to_others']
+        counts = queue['counts']
         
-        if pending_consultations:
-            # Separate assigned and unassigned cases
-            assigned_to_me = [c for c in pending_consultations if c.get('assigned_cardiologist_email') == cardiologist_email]
-            unassigned = [c for c in pending_consultations if not c.get('assigned_cardiologist_email')]
-            assigned_to_others = [c for c in pending_consultations if c.get('assigned_cardiologist_email') and c.get('assigned_cardiologist_email') != cardiologist_email]
+        if assigned_to_me or unassigned or assigned_to_others:
             
             # Show summary
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("🔴 Assigned to You", len(assigned_to_me))
+                st.metric("🔴 Assigned to You", counts['assigned_to_me'])
             with col2:
-                st.metric("🔵 Unassigned (Available)", len(unassigned))
+                st.metric("🔵 Unassigned (Available)", counts['unassigned'])
             with col3:
-                st.metric("⚪ Assigned to Others", len(assigned_to_others))
+                st.metric("⚪ Assigned to Others", counts['assigned_to_others'])
+            
+            if any(count > queue['limit'] for count in counts.values()):
+                st.caption(f"Showing the {queue['limit']} most urgent cases of each group")
             
             st.markdown("---")
             
@@ -2284,7 +2418,8 @@ elif page_clean == "💬 Respond to Consultation":
                             st.error("❌ Failed to extract consultation ID")
                             st.stop()
                         
-                        selected_consult = next((c for c in all_cases if c['consultation_id'] == consultation_id), None)
+                        # Queue rows are summaries; load the selected case in full
+                        selected_consult = get_consultation(consultation_id)
                         
                         if not selected_consult:
                             st.error(f"❌ Consultation {consultation_id} not found")
@@ -2303,6 +2438,15 @@ elif page_clean == "💬 Respond to Consultation":
                             st.info("You can still respond if needed (will override assignment)")
                     else:
                         st.info("ℹ️ **This case is unassigned** - Available for any Cardiologist")
+                        if st.button("🙋 Claim this case", key=f"claim_{consultation_id}"):
+                            claim_response = claim_consultation(consultation_id, cardiologist_email)
+                            if claim_response.status_code == 200:
+                                st.success("✅ Case claimed - it is now assigned to you")
+                                st.rerun()
+                            elif claim_response.status_code == 409:
+                                st.warning("⚠️ Another cardiologist has already claimed this case")
+                            else:
+                                st.error(f"❌ {claim_response.json().get('detail', 'Failed to claim case')}")
                     
                     st.markdown("---")
                     st.subheader("Consultation Details")
@@ -2383,10 +2527,10 @@ elif page_clean == "💬 Respond to Consultation":
                         st.markdown("**📊 Medical Images:**")
                         
                         # Display Follow-up Notes if available
-                        if selected_consult.get('followup_notes') and len(selected_consult['followup_notes']) > 0:
+                        if selected_consult.get('message_count', 0) > 0:
                             st.markdown("**📝 Follow-up Discussion from GP:**")
-                            for idx, note in enumerate(selected_consult['followup_notes'], 1):
-                                timestamp = note.get('timestamp', 'N/A')
+                            for idx, note in enumerate(get_consultation_messages(selected_consult['consultation_id']), 1):
+                                timestamp = note.get('created_at', 'N/A')
                                 if timestamp != 'N/A':
                                     try:
                                         dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
@@ -2405,8 +2549,8 @@ elif page_clean == "💬 Respond to Consultation":
                         with img_col1:
                             if selected_consult['patient'].get('ecg_image'):
                                 st.markdown("**ECG Image:**")
-                                st.image(f"http://localhost:8000/uploads/{selected_consult['patient']['ecg_image']}", 
-                                       caption="ECG", width=400)
+                                st.image(api.image_url(selected_consult['patient']['ecg_image'], width=400), caption="ECG", width=400)
+                                st.markdown(f"[🔍 Open full size]({api.image_url(selected_consult['patient']['ecg_image'])})")
                                 
                                 # Show AI analysis if available
                                 if selected_consult.get('ecg_analysis'):
@@ -2415,8 +2559,8 @@ elif page_clean == "💬 Respond to Consultation":
                         with img_col2:
                             if selected_consult['patient'].get('xray_image'):
                                 st.markdown("**X-Ray Image:**")
-                                st.image(f"http://localhost:8000/uploads/{selected_consult['patient']['xray_image']}", 
-                                       caption="X-Ray", width=400)
+                                st.image(api.image_url(selected_consult['patient']['xray_image'], width=400), caption="X-Ray", width=400)
+                                st.markdown(f"[🔍 Open full size]({api.image_url(selected_consult['patient']['xray_image'])})")
                                 
                                 # Show AI analysis if available
                                 if selected_consult.get('xray_analysis'):
@@ -2475,31 +2619,24 @@ elif page_clean == "📊 Statistics" or page_clean == "📊 My Statistics":
         st.header("System Statistics")
     
     try:
-        stats = get_stats()
-        all_consultations = get_consultations()
-        
-        # Filter consultations by user if not admin
+        # Scope stats and patient list to the user on "My Statistics" (server-side)
+        scope = {}
         if page == "📊 My Statistics":
             if user_role == 'clinic_doctor':
-                my_consultations = [c for c in all_consultations if c['clinic_doctor_email'] == user_email]
+                scope = {"clinic_doctor_email": user_email}
             else:  # cardiologist
                 # Include both responded consultations AND assigned pending consultations
-                my_consultations = [c for c in all_consultations if 
-                                   c.get('cardiologist_email') == user_email or 
-                                   c.get('assigned_cardiologist_email') == user_email]
-            
-            # Calculate user-specific stats
-            total_consultations = len(my_consultations)
-            pending = len([c for c in my_consultations if c['status'] == 'pending'])
-            reviewed = len([c for c in my_consultations if c['status'] == 'reviewed'])
-            completed = len([c for c in my_consultations if c['status'] == 'completed'])
-        else:
-            # Admin or full statistics page sees all stats
-            my_consultations = all_consultations
-            total_consultations = stats["total_consultations"]
-            pending = stats["pending"]
-            reviewed = stats["reviewed"]
-            completed = stats["completed"]
+                scope = {"cardiologist_email": user_email}
+        
+        stats = page_bundle["stats"]
+        # List rows only need summary fields; the selected file is fetched in full below
+        my_consultations, next_cursor = get_consultations("statistics_list", page_bundle["consultations"],
+                                                          **scope, view="summary")
+        
+        total_consultations = stats["total_consultations"]
+        pending = stats["pending"]
+        reviewed = stats["reviewed"]
+        completed = stats["completed"]
         
         col1, col2 = st.columns(2)
         
@@ -2579,9 +2716,11 @@ elif page_clean == "📊 Statistics" or page_clean == "📊 My Statistics":
                         status_color = {"pending": "🟡", "reviewed": "🔵", "completed": "🟢"}
                         st.write(f"{status_color.get(consult['status'], '⚪')} {consult['status'].upper()}")
                 
+                load_more_consultations("statistics_list", next_cursor)
+                
                 # Show selected patient details
                 if 'selected_patient' in st.session_state:
-                    selected_consult = next((c for c in all_consultations if c['consultation_id'] == st.session_state.selected_patient), None)
+                    selected_consult = get_consultation(st.session_state.selected_patient)
                     
                     if selected_consult:
                         st.markdown("---")
@@ -2622,15 +2761,16 @@ elif page_clean == "📊 Statistics" or page_clean == "📊 My Statistics":
                             with img_col1:
                                 if selected_consult['patient'].get('ecg_image'):
                                     st.markdown("**📊 ECG Image:**")
-                                    st.image(f"http://localhost:8000/uploads/{selected_consult['patient']['ecg_image']}", 
-                                           caption="ECG", width=400)
+                                    st.image(api.image_url(selected_consult['patient']['ecg_image'], width=400), caption="ECG", width=400)
+                                    st.markdown(f"[🔍 Open full size]({api.image_url(selected_consult['patient']['ecg_image'])})")
                                     
                                     # AI Analysis button for ECG
                                     if st.button("🤖 Analyse with NEXUS AI", key="btn_analyze_ecg"):
                                             with st.spinner("🔄 Analyzing ECG image..."):
-                                                response = requests.post(
-                                                    f"{API_URL}/consultations/{selected_consult['consultation_id']}/analyze-image",
-                                                    params={"image_type": "ecg"}
+                                                response = api.post(
+                                                    f"/consultations/{selected_consult['consultation_id']}/analyze-image",
+                                                    params={"image_type": "ecg"},
+                                                    timeout=LONG_TIMEOUT
                                                 )
                                                 if response.status_code == 200:
                                                     result = response.json()
@@ -2648,15 +2788,16 @@ elif page_clean == "📊 Statistics" or page_clean == "📊 My Statistics":
                             with img_col2:
                                 if selected_consult['patient'].get('xray_image'):
                                     st.markdown("**🩻 X-Ray Image:**")
-                                    st.image(f"http://localhost:8000/uploads/{selected_consult['patient']['xray_image']}", 
-                                           caption="X-Ray", width=400)
+                                    st.image(api.image_url(selected_consult['patient']['xray_image'], width=400), caption="X-Ray", width=400)
+                                    st.markdown(f"[🔍 Open full size]({api.image_url(selected_consult['patient']['xray_image'])})")
                                     
                                     # AI Analysis button for X-Ray
                                     if st.button("🤖 Analyse with NEXUS AI", key="btn_analyze_xray"):
                                             with st.spinner("🔄 Analyzing X-Ray image..."):
-                                                response = requests.post(
-                                                    f"{API_URL}/consultations/{selected_consult['consultation_id']}/analyze-image",
-                                                    params={"image_type": "xray"}
+                                                response = api.post(
+                                                    f"/consultations/{selected_consult['consultation_id']}/analyze-image",
+                                                    params={"image_type": "xray"},
+                                                    timeout=LONG_TIMEOUT
                                                 )
                                                 if response.status_code == 200:
                                                     result = response.json()
@@ -0,0 +1,15 @@
+"""
+GPLink - Test Configuration
+Backend modules use flat imports, so tests import them from backend/ directly
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+# Point the backend at a throwaway database on a local mongod before database.py is imported
+TEST_MONGODB_URI = os.getenv("GPLINK_TEST_MONGODB_URI", "mongodb://localhost:27017")
+os.environ["MONGODB_ATLAS_CLUSTER_URI"] = TEST_MONGODB_URI
+os.environ["MONGODB_DATABASE_NAME"] = "gplink_query_plan_test"
@@ -0,0 +1,108 @@
+"""
+GPLink - Query Plan Tests
+Seeds a local mongod and fails if any API query shape needs a COLLSCAN or in-memory SORT.
+
+Skipped when no server answers at GPLINK_TEST_MONGODB_URI (default mongodb://localhost:27017).
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+pytest.importorskip("fastapi")
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import crud
+import database
+import indexes
+
+SEED_DOCTORS = 60
+SEED_CONSULTATIONS = 3000
+SEED_MESSAGES = 1000
+
+SHAPE_NAMES = [shape["name"] for shape in indexes.query_shapes() + indexes.aggregate_shapes()]
+# Building the shapes touched the lazy client; let the test's event loop create its own
+database.close()
+
+def _doctors() -> list:
+    doctors = []
+    for i in range(SEED_DOCTORS):
+        role = "cardiologist" if i % 3 == 0 else "clinic_doctor"
+        email = indexes._EMAIL if i == 0 else f"doctor{i}@example.com"
+        doctors.append(crud.new_version({
+            "name": f"Doctor {i:03d}", "email": email, "role": role,
+            "hospital_clinic": f"Clinic {i % 7}", "created_at": datetime(2025, 1, 1)
+        }))
+    return doctors
+
+def _consultations(doctors: list) -> list:
+    emails = [doctor["email"] for doctor in doctors]
+    statuses = ["pending", "reviewed", "completed"]
+    urgencies = list(crud.URGENCY_RANK)
+    started = datetime(2025, 1, 1)
+    consultations = []
+    for i in range(SEED_CONSULTATIONS):
+        created_at = started + timedelta(minutes=17 * i)
+        assigned = [None, "", emails[i % SEED_DOCTORS], indexes._EMAIL][i % 4]
+        status = statuses[i % 3]
+        consultations.append(crud.new_version({
+            "consultation_id": crud.new_consultation_id(created_at),
+            "patient": {"name": f"Patient {i}", "age": 40 + i % 40, "gender": "F", "ic_number": f"IC{i}"},
+            "symptoms": "Chest pain",
+            "vital_signs": {},
+            "clinic_doctor_email": emails[(i * 7) % SEED_DOCTORS],
+            "clinic_doctor_name": f"Doctor {(i * 7) % SEED_DOCTORS:03d}",
+            "urgency": urgencies[i % len(urgencies)],
+            "urgency_rank": crud.urgency_rank(urgencies[i % len(urgencies)]),
+            "status": status,
+            "created_at": created_at,
+            "assigned_cardiologist_email": assigned,
+            "cardiologist_email": assigned if status != "pending" else None,
+            "message_count": 0,
+            "last_activity_at": created_at
+        }))
+    return consultations
+
+async def _seed_and_explain() -> dict:
+    db = database.get_db()
+    await db.client.drop_database(db.name)
+    try:
+        await indexes.sync_indexes()
+        doctors = _doctors()
+        consultations = _consultations(doctors)
+        await database.doctors_collection().insert_many(doctors)
+        await database.consultations_collection().insert_many(consultations)
+        await database.messages_collection().insert_many([
+            {"consultation_id": consultations[i % 100]["consultation_id"], "note": "Follow-up",
+             "created_at": consultations[i % 100]["created_at"] + timedelta(hours=i)}
+            for i in range(SEED_MESSAGES)
+        ])
+        await crud.reconcile_counters()
+        return await indexes.explain_shapes()
+    finally:
+        await db.client.drop_database(db.name)
+
+@pytest.fixture(scope="module")
+def plans():
+    client = MongoClient(os.environ["MONGODB_ATLAS_CLUSTER_URI"], serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("no mongod reachable for query plan tests")
+    finally:
+        client.close()
+    try:
+        return asyncio.run(_seed_and_explain())
+    finally:
+        database.close()
+
+@pytest.mark.parametrize("shape", SHAPE_NAMES)
+def test_query_shape_is_index_backed(plans, shape):
+    stages = plans[shape]
+    assert "COLLSCAN" not in stages, f"{shape} scans the whole collection: {sorted(stages)}"
+    assert "SORT" not in stages, f"{shape} sorts in memory: {sorted(stages)}"